@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        import api.signals  # noqa: F401
+        if settings.API_METRICS_ENABLED:
+            from api.metrics import metrics
+            from user.authentication import token_cache
+            metrics.collectors.append(token_cache.collect_metrics)
@@ -0,0 +1,181 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, parse_etags, quote_etag
+
+
+class VersionedCache:
+    """Кэш сериализованных ответов с версией таблицы в ключе.
+
+    Изменение таблицы увеличивает её версию, и все ранее сохранённые
+    ответы перестают использоваться без явного удаления. Начальная
+    версия берётся от текущего времени, чтобы после вытеснения счётчика
+    из кэша не вернуть устаревшие ответы.
+
+    С кэшем в памяти процесса версия, увеличенная в другом воркере или
+    команде manage.py, не видна, поэтому кэш ответов отключается."""
+    prefix = 'api'
+
+    @property
+    def cache(self):
+        return caches[settings.API_CACHE_ALIAS]
+
+    @property
+    def enabled(self):
+        return not isinstance(self.cache, LocMemCache)
+
+    def version_key(self, model):
+        return f'{self.prefix}:version:{model._meta.label_lower}'
+
+    def get_version(self, model):
+        key = self.version_key(model)
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, time.time_ns(), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, model):
+        key = self.version_key(model)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, time.time_ns(), timeout=None)
+
+    def make_key(self, model, *parts):
+        digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+        return (f'{self.prefix}:response:{model._meta.label_lower}:'
+                f'{self.get_version(model)}:{digest}')
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def get_or_set(self, model, name, default):
+        """Значение, вычисленное по таблице model и сбрасываемое вместе
+        с её версией."""
+        if not self.enabled:
+            return default()
+        return self.cache.get_or_set(
+            self.make_key(model, name), default,
+            timeout=settings.API_CACHE_TIMEOUT
+        )
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=settings.API_CACHE_TIMEOUT)
+
+
+response_cache = VersionedCache()
+
+
+class VersionedCacheMixin:
+    """Отдаёт list и retrieve из кэша ответов со строгим ETag и
+    отвечает 304 на совпадающий If-None-Match.
+
+    Подходит только для данных, одинаковых для всех пользователей. Если
+    кэш ответов отключён, ответ строится на каждый запрос."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json' or not response_cache.enabled:
+            return handler(request, *args, **kwargs)
+        key = response_cache.make_key(
+            self.get_queryset().model, request.get_full_path(),
+            request.accepted_media_type
+        )
+        entry = response_cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            etag = f'"{hashlib.sha1(content).hexdigest()}"'
+            entry = (content, etag)
+            response_cache.set(key, entry)
+        content, etag = entry
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content, content_type=request.accepted_media_type)
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на list и retrieve до выполнения запроса данных и
+    сериализации, если состояние ресурса не изменилось.
+
+    get_condition возвращает пару (состояние, дата изменения) или None,
+    если условный ответ невозможен. Из состояния и адреса запроса
+    строится ETag, дата изменения используется для Last-Modified.
+
+    Состояние запрашивается только для запросов с If-None-Match или
+    If-Modified-Since. Остальные ответы получают ETag по содержимому:
+    в ответ на него клиент один раз получает полный ответ с ETag по
+    состоянию, а дальше 304."""
+    etag_from_content = False
+
+    def get_condition(self):
+        raise NotImplementedError(
+            'Метод get_condition() должен быть определён.')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if not ('If-None-Match' in request.headers
+                or 'If-Modified-Since' in request.headers):
+            self.etag_from_content = True
+            return handler(request, *args, **kwargs)
+        condition = self.get_condition()
+        if condition is None:
+            return handler(request, *args, **kwargs)
+        state, last_modified = condition
+        etag = quote_etag(hashlib.md5(repr((
+            state, request.get_full_path(), request.accepted_media_type
+        )).encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if self.etag_from_content and response.status_code == 200:
+            response['ETag'] = quote_etag(
+                hashlib.sha1(response.render().content).hexdigest())
+            patch_cache_control(response, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
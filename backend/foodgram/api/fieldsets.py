@@ -0,0 +1,40 @@
+from rest_framework.exceptions import ValidationError
+
+
+class SparseFieldsMixin:
+    """Параметры запроса fields и expand для сериализаторов с
+    атрибутами field_names и expandable_fields.
+
+    fields — поля ответа через запятую, expand — связи, которые
+    раскрываются в объекты, остальные связи отдаются идентификаторами.
+    Без параметров отдаются все поля и раскрываются все связи.
+    Остальные сериализаторы параметры игнорируют."""
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def parse_names(self, param, allowed):
+        value = self.request.query_params.get(param)
+        if allowed is None or value is None:
+            return None
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = sorted(names.difference(allowed))
+        if unknown:
+            raise ValidationError({param: [
+                f'Неизвестное поле {name}.' for name in unknown]})
+        return names
+
+    def get_sparse_fields(self):
+        return self.parse_names(
+            self.fields_query_param,
+            getattr(self.get_serializer_class(), 'field_names', None))
+
+    def get_expanded_fields(self):
+        return self.parse_names(
+            self.expand_query_param,
+            getattr(self.get_serializer_class(), 'expandable_fields', None))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_sparse_fields()
+        context['expand'] = self.get_expanded_fields()
+        return context
@@ -1,6 +1,34 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Ingredient
+from api.cache import response_cache
+from recipes.models import Recipe, Ingredient, Tag
+from recipes.search import search_recipes
+
+
+class MultipleValueField(forms.Field):
+    """Поле со списком значений из повторяющегося параметра запроса."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = [value]
+        return [item for item in value if item]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
+
+
+def get_tag_ids_by_slug():
+    """Соответствие слагов тегов их id из кэша таблицы тегов."""
+    return response_cache.get_or_set(
+        Tag, 'tag_ids_by_slug',
+        lambda: dict(Tag.objects.values_list('slug', 'id'))
+    )
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,9 +36,9 @@ class RecipeFilter(filters.FilterSet):
         field_name='author__pk',
         lookup_expr='exact'
     )
-    tags = filters.CharFilter(
+    tags = MultipleValueFilter(
         field_name='tags__slug',
-        lookup_expr='exact'
+        method='filter_tags'
     )
     is_favorited = filters.NumberFilter(
         field_name='favoriterecipe',
@@ -20,6 +48,19 @@ class RecipeFilter(filters.FilterSet):
         field_name='user_cart',
         method='filter_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов: полусоединение EXISTS не
+        размножает строки и не требует DISTINCT."""
+        tag_ids_by_slug = get_tag_ids_by_slug()
+        tag_ids = [
+            tag_ids_by_slug[slug] for slug in value if slug in tag_ids_by_slug
+        ]
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids)))
 
     def filter_favorite(self, queryset, name, value):
         user = self.request.user
@@ -33,6 +74,9 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(user_cart__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
         fields = 'author', 'tags'
@@ -0,0 +1,229 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class RequestRecorder:
+    """Счётчики одного запроса. Вызывается как обёртка выполнения SQL
+    (connection.execute_wrapper)."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0
+        self.serializer_time = 0
+        self.serializing = False
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+            self.fingerprints[IN_LIST.sub('IN (...)', sql)] += 1
+
+    def duplicates(self, limit=5):
+        return [
+            (fingerprint, count)
+            for fingerprint, count in self.fingerprints.most_common(limit)
+            if count > 1
+        ]
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с меткой view."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts = {}
+        self.sums = Counter()
+
+    def observe(self, view, value):
+        counts = self.counts.setdefault(view, [0] * (len(self.buckets) + 1))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-1] += 1
+        self.sums[view] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        for view, counts in sorted(self.counts.items()):
+            bounds = [*map(str, self.buckets), '+Inf']
+            for bound, count in zip(bounds, counts):
+                lines.append(f'{self.name}_bucket'
+                             f'{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {self.sums[view]}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {counts[-1]}')
+        return lines
+
+
+class Metrics:
+    """Агрегированные метрики запросов процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {
+            'total': Histogram(
+                'foodgram_request_duration_seconds',
+                'Полное время обработки запроса.', SECONDS_BUCKETS),
+            'sql_time': Histogram(
+                'foodgram_sql_duration_seconds',
+                'Время выполнения SQL за запрос.', SECONDS_BUCKETS),
+            'sql_count': Histogram(
+                'foodgram_sql_queries',
+                'Количество SQL запросов за запрос.', QUERY_BUCKETS),
+            'serializer_time': Histogram(
+                'foodgram_serializer_duration_seconds',
+                'Время сериализации ответа, включая ленивые запросы.',
+                SECONDS_BUCKETS),
+        }
+        # Функции, возвращающие дополнительные строки метрик.
+        self.collectors = []
+
+    def observe(self, view, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.histograms[name].observe(view, value)
+
+    def render(self):
+        with self.lock:
+            lines = [
+                line for histogram in self.histograms.values()
+                for line in histogram.render()
+            ]
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def get_view_name(request, view_func):
+    """Имя представления вида RecipeViewSet.download_shopping_cart."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return request.resolver_match.view_name or view_func.__name__
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class TimedDataMixin:
+    """Замеряет получение data сериализатора. Время вложенных
+    сериализаторов входит во внешний замер."""
+
+    @property
+    def data(self):
+        recorder = current_recorder.get()
+        if recorder is None or recorder.serializing:
+            return super().data
+        recorder.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            recorder.serializer_time += time.perf_counter() - started
+            recorder.serializing = False
+
+
+timed_classes = {}
+
+
+def get_timed_class(serializer_class):
+    """Подкласс сериализатора с замером data, один на каждый класс."""
+    if issubclass(serializer_class, TimedDataMixin):
+        return serializer_class
+    timed_class = timed_classes.get(serializer_class)
+    if timed_class is None:
+        timed_class = timed_classes.setdefault(serializer_class, type(
+            serializer_class.__name__, (TimedDataMixin, serializer_class),
+            {'__module__': serializer_class.__module__}
+        ))
+    return timed_class
+
+
+class SerializerTimingMixin:
+    """Замеряет время сериализации ответов представления.
+
+    Сериализатор из get_serializer, в том числе ListSerializer при
+    many=True, получает подкласс с замером data. Без включённого
+    QueryMetricsMiddleware сериализатор не меняется."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if current_recorder.get() is not None:
+            serializer.__class__ = get_timed_class(type(serializer))
+        return serializer
+
+
+class QueryMetricsMiddleware:
+    """Считает SQL запросы и время обработки каждого запроса к
+    представлениям и предупреждает о превышении бюджета запросов.
+
+    Запросы, выполняемые при потоковой отдаче ответа, не учитываются."""
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view_name = get_view_name(request, view_func)
+
+    def __call__(self, request):
+        recorder = RequestRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        view_name = getattr(request, 'metrics_view_name', None)
+        if view_name is not None:
+            self.record(view_name, recorder, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(view_name, recorder, total):
+        metrics.observe(
+            view_name,
+            total=total,
+            sql_time=recorder.sql_time,
+            sql_count=recorder.sql_count,
+            serializer_time=recorder.serializer_time
+        )
+        if recorder.sql_count > settings.API_QUERY_BUDGET:
+            logger.warning(
+                '%s: %s SQL запросов при бюджете %s. Повторяющиеся: %s',
+                view_name, recorder.sql_count, settings.API_QUERY_BUDGET,
+                '; '.join(f'{count} x {fingerprint}'
+                          for fingerprint, count in recorder.duplicates())
+                or 'нет'
+            )
@@ -1,6 +1,92 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db import connections
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
 
 
 class PageLimitPagination(PageNumberPagination):
-    page_size = 1
+    page_size = 6
+    page_size_query_param = 'limit'
+
+
+class KeysetPagination(CursorPagination):
+    """Пагинация по ключу -id с непрозрачным курсором, без COUNT(*) и
+    OFFSET. С параметром count=1 в ответ добавляется оценка количества
+    объектов: для PostgreSQL из статистики планировщика."""
+    ordering = '-id'
+    page_size = 6
     page_size_query_param = 'limit'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = self.estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def estimate_count(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    (queryset.model._meta.db_table,)
+                )
+                row = cursor.fetchone()
+            # reltuples равен -1, пока таблица не проанализирована.
+            if row and row[0] >= 0:
+                return row[0]
+            return queryset.count()
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return plan[0]['Plan']['Plan Rows']
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class PageOrCursorPagination(BasePagination):
+    """Постраничная пагинация для запросов с параметром page, которые
+    отправляет фронтенд, и пагинация по ключу для остальных.
+
+    Выборки с собственной сортировкой (например, поиск по
+    релевантности) всегда разбиваются на страницы по номеру."""
+    page_class = PageLimitPagination
+    cursor_class = KeysetPagination
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, queryset, request):
+        ordering = tuple(queryset.query.order_by)
+        if (self.page_class.page_query_param in request.query_params
+                or ordering not in ((), (self.cursor_class.ordering,))):
+            return self.page_class()
+        return self.cursor_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(queryset, request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def to_html(self):
+        return self.paginator.to_html()
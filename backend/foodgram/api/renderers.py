@@ -0,0 +1,234 @@
+import csv
+import json
+
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+CYRILLIC = 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSON рендерер на orjson. Вывод совпадает с JSONRenderer:
+    компактный или с отступом в 2 пробела, без экранирования не-ASCII
+    символов, кроме U+2028 и U+2029. Дата и время кодируются
+    JSONEncoder DRF, с Z вместо +00:00. Другие отступы orjson не
+    поддерживает, их выводит JSONRenderer."""
+    default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent not in (None, 2):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        content = orjson.dumps(data, default=self.default, option=option)
+        return content.replace(
+            '\u2028'.encode(), b'\\u2028').replace(
+            '\u2029'.encode(), b'\\u2029')
+
+
+def shopping_list_line(row):
+    """Строка списка покупок в текстовом виде."""
+    return f'{row["name"]}({row["measurement_unit"]})—{row["amount"]}'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """Базовый рендерер выгрузки списка покупок.
+
+    Список отдаётся потоком через stream, ответы с ошибками
+    RecipeViewSet отдаёт в JSON."""
+    charset = 'utf-8'
+    fields = ('name', 'measurement_unit', 'amount')
+
+    def get_content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def stream(self, rows):
+        raise NotImplementedError('Метод stream() должен быть определён.')
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for row in rows:
+            yield shopping_list_line(row) + '\n'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.DictWriter(Echo(), fieldnames=self.fields)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps(
+                {field: row[field] for field in self.fields},
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+class PDFWriter:
+    """Минимальный потоковый генератор PDF.
+
+    Использует встроенный шрифт Helvetica с кодировкой cp1251, поэтому
+    не требует внешних зависимостей и файлов шрифтов."""
+    catalog_id = 1
+    pages_id = 2
+    font_id = 3
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 12
+    leading = 16
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.page_ids = []
+        self.next_id = self.font_id + 1
+
+    @staticmethod
+    def cyrillic_differences():
+        """Сопоставляет байты cp1251 с именами кириллических глифов."""
+        parts = []
+        previous = None
+        for code in [0xA8, 0xB8, *range(0xC0, 0x100)]:
+            if previous is None or code != previous + 1:
+                parts.append(str(code))
+            letter = bytes([code]).decode('cp1251')
+            base = 10017 if letter.isupper() else 10065
+            parts.append(f'/afii{base + CYRILLIC.index(letter.upper())}')
+            previous = code
+        return ' '.join(parts).encode()
+
+    @staticmethod
+    def escape(line):
+        return line.encode('cp1251', errors='replace').replace(
+            b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (object_id, body)
+        self.position += len(chunk)
+        return chunk
+
+    def start(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.position = len(header)
+        return header + self.write_object(self.font_id, (
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            b'/Differences [%s] >> >>' % self.cyrillic_differences()
+        ))
+
+    @property
+    def lines_per_page(self):
+        return (self.page_height - 2 * self.margin) // self.leading
+
+    def page(self, lines):
+        content = b'BT /F1 %d Tf %d TL %d %d Td %s ET' % (
+            self.font_size, self.leading, self.margin,
+            self.page_height - self.margin,
+            b' '.join(b'(%s) Tj T*' % self.escape(line) for line in lines)
+        )
+        content_id = self.next_id
+        page_id = content_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return self.write_object(content_id, (
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (
+                len(content), content)
+        )) + self.write_object(page_id, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (self.pages_id, self.page_width, self.page_height,
+               self.font_id, content_id)
+        ))
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        chunk = self.write_object(self.pages_id, (
+            b'<< /Type /Pages /Kids [%s] /Count %d >>'
+            % (kids, len(self.page_ids))
+        )) + self.write_object(self.catalog_id, (
+            b'<< /Type /Catalog /Pages %d 0 R >>' % self.pages_id
+        ))
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id]
+        xref.extend(
+            b'%010d 00000 n \n' % self.offsets[object_id]
+            for object_id in range(1, self.next_id)
+        )
+        xref.append(
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (self.next_id, self.catalog_id, self.position)
+        )
+        return chunk + b''.join(xref)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    title = 'Список покупок'
+
+    def stream(self, rows):
+        writer = PDFWriter()
+        yield writer.start()
+        lines = [self.title, '']
+        for row in rows:
+            lines.append(shopping_list_line(row))
+            if len(lines) == writer.lines_per_page:
+                yield writer.page(lines)
+                lines = []
+        if lines or not writer.page_ids:
+            yield writer.page(lines)
+        yield writer.finish()
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    """Текстовый формат метрик Prometheus."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode()
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
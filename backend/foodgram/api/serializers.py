@@ -1,17 +1,72 @@
+from collections import Counter
+
 from drf_extra_fields.fields import Base64ImageField
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core import exceptions as django_exceptions
-from django.db import IntegrityError
-from django.db.models import F
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
+from rest_framework.relations import PrimaryKeyRelatedField
 
 from recipes.models import (Ingredient, Recipe, Tag,
                             IngredientRecipeAmount)
+from recipes.search import update_search_vectors
+from recipes.utils import update_recipe_in_shopping_lists
 from user.models import User
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта: принимается в base64, а отдаётся ссылкой на
+    копию, подходящую для списка или страницы рецепта, если она уже
+    создана, иначе на оригинал."""
+    def __init__(self, *args, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get('view')
+        if getattr(view, 'detail', True):
+            return 'preview'
+        return 'thumbnail'
+
+    def to_representation(self, value):
+        if value:
+            value = getattr(
+                value.instance, f'image_{self.get_variant()}', None) or value
+        return super().to_representation(value)
+
+
+def image_url(image, request):
+    """Ссылка на файл в том же виде, что у ImageField."""
+    if not image:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(image.url)
+    return image.url
+
+
+def ingredients_data(recipe):
+    """Ингредиенты рецепта с количеством. Без подгрузки, например после
+    создания или изменения рецепта, ингредиенты читаются одним
+    запросом."""
+    items = recipe.ingredientrecipeamount_set.all()
+    if 'ingredientrecipeamount_set' not in getattr(
+            recipe, '_prefetched_objects_cache', {}):
+        items = items.select_related('ingredient')
+    return [
+        {
+            'id': item.ingredient.id,
+            'name': item.ingredient.name,
+            'measurement_unit': item.ingredient.measurement_unit,
+            'amount': item.amount
+        }
+        for item in items
+    ]
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тегов."""
     class Meta:
@@ -29,20 +84,30 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientRecipeSerializer(serializers.Serializer):
     """Вспомогательный сериализатор игредиентов для валидации и
     создания связи с количеством."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), required=True)
+    id = serializers.IntegerField(required=True)
     amount = serializers.IntegerField(min_value=1, required=True)
 
 
+class BatchSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетных действий."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 class TagTagSerializer(serializers.Serializer):
     """Вспомогательный сериализатор тегов для валидации и
     создания связи с рецептом."""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, required=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True)
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор вывода рецептов."""
+    image = RecipeImageField(variant='thumbnail', read_only=True)
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -60,6 +125,8 @@ class UserSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -68,7 +135,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 class FullRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов."""
-    image = Base64ImageField(allow_null=False)
+    image = RecipeImageField(allow_null=False)
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(
         read_only=True, default=serializers.CurrentUserDefault()
@@ -84,60 +151,119 @@ class FullRecipeSerializer(serializers.ModelSerializer):
                   'name', 'image', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return user.favorite_recipes.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return user.cart_recipes.filter(recipe=obj).exists()
 
     def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id', 'name', 'measurement_unit',
-            amount=F('ingredientrecipeamount__amount')
-        )
+        return ingredients_data(obj)
+
+    @staticmethod
+    def get_objects_in_bulk(model, pks, field_name):
+        """Получает объекты по списку ключей одним запросом."""
+        objects = model.objects.in_bulk(set(pks))
+        missing = sorted(set(pks) - objects.keys())
+        if missing:
+            message = PrimaryKeyRelatedField.default_error_messages[
+                'does_not_exist']
+            raise serializers.ValidationError({field_name: [
+                message.format(pk_value=pk) for pk in missing
+            ]})
+        return objects
 
     def validate(self, attrs):
         tags = self.initial_data.get('tags')
         tag_serializer = TagTagSerializer(data={'tags': tags})
         tag_serializer.is_valid(raise_exception=True)
-        attrs.update(tag_serializer.validated_data)
-        ingredients = self.initial_data.get('ingredients')
-        lst = []
-        for ingredient in ingredients:
-            ingredient_serializer = IngredientRecipeSerializer(data=ingredient)
-            ingredient_serializer.is_valid(raise_exception=True)
-            lst.append(ingredient_serializer.validated_data)
-        attrs.update({'ingredients': lst})
+        tag_ids = tag_serializer.validated_data['tags']
+        tag_objects = self.get_objects_in_bulk(Tag, tag_ids, 'tags')
+        attrs['tags'] = [tag_objects[pk] for pk in tag_ids]
+        ingredient_serializer = IngredientRecipeSerializer(
+            data=self.initial_data.get('ingredients'), many=True)
+        ingredient_serializer.is_valid(raise_exception=True)
+        ingredients = ingredient_serializer.validated_data
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ingredient_ids) != len(set(ingredient_ids)):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиенты не должны повторяться.'})
+        ingredient_objects = self.get_objects_in_bulk(
+            Ingredient, ingredient_ids, 'ingredients')
+        attrs['ingredients'] = [
+            {'id': ingredient_objects[ingredient['id']],
+             'amount': ingredient['amount']}
+            for ingredient in ingredients
+        ]
         return attrs
 
+    @staticmethod
+    def set_ingredients(recipe, ingredients):
+        """Приводит ингредиенты рецепта к переданному списку, изменяя
+        только отличающиеся строки пакетными запросами."""
+        current = {}
+        stale = []
+        deltas = Counter()
+        for row in recipe.ingredientrecipeamount_set.all():
+            deltas[row.ingredient_id] -= row.amount
+            if row.ingredient_id in current:
+                stale.append(row.pk)
+            else:
+                current[row.ingredient_id] = row
+        to_create = []
+        to_update = []
+        for ingredient in ingredients:
+            deltas[ingredient['id'].id] += ingredient['amount']
+            row = current.pop(ingredient['id'].id, None)
+            if row is None:
+                to_create.append(IngredientRecipeAmount(
+                    amount=ingredient['amount'],
+                    recipe=recipe,
+                    ingredient=ingredient['id']
+                ))
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                to_update.append(row)
+        stale.extend(row.pk for row in current.values())
+        if stale:
+            IngredientRecipeAmount.objects.filter(pk__in=stale).delete()
+        IngredientRecipeAmount.objects.bulk_update(to_update, ('amount',))
+        IngredientRecipeAmount.objects.bulk_create(to_create)
+        update_recipe_in_shopping_lists(recipe.pk, deltas)
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
+        IngredientRecipeAmount.objects.bulk_create(
             IngredientRecipeAmount(
-                amount=ingredient.get('amount'),
+                amount=ingredient['amount'],
                 recipe=recipe,
-                ingredient=ingredient.get('id')
-            ).save()
+                ingredient=ingredient['id']
+            )
+            for ingredient in ingredients
+        )
+        update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        for ingredient in ingredients:
-            IngredientRecipeAmount.objects.get_or_create(
-                amount=ingredient.get('amount'),
-                recipe=instance,
-                ingredient=ingredient.get('id')
-            )
-        return super().update(instance, validated_data)
+        self.set_ingredients(instance, ingredients)
+        instance = super().update(instance, validated_data)
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+        return instance
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -156,6 +282,10 @@ class SubscribeSerializer(serializers.ModelSerializer):
         read_only_fields = ('__all__',)
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return RecipeSerializer(obj.limited_recipes,
+                                    many=True,
+                                    context=self.context).data
         limit = self.context.get('request').query_params.get('recipes_limit')
         if limit and limit.isdecimal():
             return RecipeSerializer(
@@ -168,13 +298,171 @@ class SubscribeSerializer(serializers.ModelSerializer):
                                 context=self.context).data
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return obj.following.filter(user=user).exists()
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
+class ReadOnlySerializer(serializers.BaseSerializer):
+    """Основа сериализаторов только для чтения, которые собирают
+    словари из подгруженных объектов без полей DRF. Поле name выводит
+    метод represent_name.
+
+    Контекст fields ограничивает набор полей, а expand — связи из
+    expandable_fields, которые раскрываются в объекты, остальные
+    связи выводятся идентификаторами. None — все поля и связи."""
+    field_names = ()
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        self.expand = self.context.get('expand')
+        self.representers = [
+            (name, getattr(self, f'represent_{name}'))
+            for name in self.field_names
+            if fields is None or name in fields
+        ]
+
+    def is_expanded(self, name):
+        return self.expand is None or name in self.expand
+
+    def to_representation(self, instance):
+        return {
+            name: represent(instance)
+            for name, represent in self.representers
+        }
+
+
+class UserReadSerializer(ReadOnlySerializer):
+    """Сериализатор пользователей только для чтения, вывод совпадает с
+    UserSerializer."""
+    field_names = ('email', 'id', 'username',
+                   'first_name', 'last_name', 'is_subscribed')
+
+    def represent_email(self, instance):
+        return instance.email
+
+    def represent_id(self, instance):
+        return instance.id
+
+    def represent_username(self, instance):
+        return instance.username
+
+    def represent_first_name(self, instance):
+        return instance.first_name
+
+    def represent_last_name(self, instance):
+        return instance.last_name
+
+    def represent_is_subscribed(self, instance):
+        if hasattr(instance, 'is_subscribed'):
+            return instance.is_subscribed
+        user = self.context.get('request').user
+        if user.is_anonymous:
+            return False
+        return user.follower.filter(author=instance).exists()
+
+
+class RecipeReadSerializer(ReadOnlySerializer):
+    """Сериализатор рецептов только для чтения, вывод совпадает с
+    FullRecipeSerializer. Ожидает рецепты из
+    RecipeQuerySet.with_related с теми же fields и expand."""
+    field_names = ('id', 'tags', 'author', 'ingredients',
+                   'is_favorited', 'is_in_shopping_cart',
+                   'name', 'image', 'text', 'cooking_time')
+    expandable_fields = ('tags', 'author', 'ingredients')
+
+    def __init__(self, *args, variant=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if variant is None:
+            view = self.context.get('view')
+            variant = ('preview' if getattr(view, 'detail', True)
+                       else 'thumbnail')
+        self.image_field = f'image_{variant}'
+        self.author_serializer = UserReadSerializer(
+            context={'request': self.context.get('request')})
+
+    def represent_id(self, instance):
+        return instance.id
+
+    def represent_tags(self, instance):
+        if not self.is_expanded('tags'):
+            return [tag.id for tag in instance.tags.all()]
+        return [
+            {'id': tag.id, 'name': tag.name,
+             'color': tag.color, 'slug': tag.slug}
+            for tag in instance.tags.all()
+        ]
+
+    def represent_author(self, instance):
+        if not self.is_expanded('author'):
+            return instance.author_id
+        return self.author_serializer.to_representation(instance.author)
+
+    def represent_ingredients(self, instance):
+        if not self.is_expanded('ingredients'):
+            return [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in instance.ingredientrecipeamount_set.all()
+            ]
+        return ingredients_data(instance)
+
+    def represent_is_favorited(self, instance):
+        return instance.is_favorited
+
+    def represent_is_in_shopping_cart(self, instance):
+        return instance.is_in_shopping_cart
+
+    def represent_name(self, instance):
+        return instance.name
+
+    def represent_image(self, instance):
+        return image_url(getattr(instance, self.image_field) or instance.image,
+                         self.context.get('request'))
+
+    def represent_text(self, instance):
+        return instance.text
+
+    def represent_cooking_time(self, instance):
+        return instance.cooking_time
+
+
+class SubscriptionReadSerializer(UserReadSerializer):
+    """Сериализатор подписок только для чтения, вывод совпадает с
+    SubscribeSerializer. Ожидает авторов с аннотацией recipes_count и
+    рецептами в limited_recipes."""
+    field_names = UserReadSerializer.field_names + ('recipes',
+                                                    'recipes_count')
+    expandable_fields = ('recipes',)
+    recipe_fields = ('id', 'name', 'image', 'cooking_time')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recipe_serializer = RecipeReadSerializer(
+            variant='thumbnail',
+            context={'request': self.context.get('request'),
+                     'fields': self.recipe_fields}
+        )
+
+    def represent_recipes(self, instance):
+        if not self.is_expanded('recipes'):
+            return [recipe.id for recipe in instance.limited_recipes]
+        return [
+            self.recipe_serializer.to_representation(recipe)
+            for recipe in instance.limited_recipes
+        ]
+
+    def represent_recipes_count(self, instance):
+        return instance.recipes_count
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для регистрации новых пользователей."""
     password = serializers.CharField(
@@ -252,19 +540,15 @@ class TokenCreateSerializer(serializers.Serializer):
         self.user = None
 
     def validate(self, attrs):
-        password = attrs.get('password')
-        email = attrs.get('email')
         self.user = authenticate(
             request=self.context.get('request'),
-            email=email,
-            password=password
+            email=attrs.get('email'),
+            password=attrs.get('password')
         )
         if not self.user:
-            self.user = User.objects.filter(email=email).first()
-            if self.user and not self.user.check_password(password):
-                self.fail('invalid_credentials')
-            if not self.user and not self.user.is_active:
-                self.fail('access error')
+            self.fail('invalid_credentials')
+        if not self.user.is_active:
+            self.fail('access error')
         return attrs
 
 
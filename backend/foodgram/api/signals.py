@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import response_cache
+from recipes.models import Ingredient, Tag
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_response_cache_version(sender, **kwargs):
+    """Сбрасывает кэш ответов таблицы после фиксации изменений."""
+    transaction.on_commit(lambda: response_cache.bump(sender))
@@ -0,0 +1,593 @@
+import datetime
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+
+from django.db import connection, connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api import serializers
+from api.metrics import TimedDataMixin, get_timed_class, metrics
+from api.renderers import ORJSONRenderer
+from api.views import RecipeViewSet
+from recipes.models import (FavoriteRecipe, FeedItem, Ingredient,
+                            IngredientRecipeAmount, Recipe, ShoppingCart,
+                            Tag)
+from recipes.utils import live_shopping_lists, stored_shopping_lists
+from user.models import Follow, User
+from user.views import UserViewSet
+
+
+class RecipeDataTestCase(TestCase):
+    """Пользователи, рецепты с тегами и ингредиентами, подписка,
+    избранное и корзина первого пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{i}@foodgram.ru', username=f'user{i}',
+                first_name='Имя', last_name='Фамилия', password='Pass12345!'
+            ) for i in range(4)
+        ]
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}') for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(6)
+        ]
+        for i in range(24):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', image='recipes/images/recipe.png',
+                text='Описание', cooking_time=10,
+                author=cls.users[i % len(cls.users)]
+            )
+            recipe.tags.set(tags[:1 + i % len(tags)])
+            IngredientRecipeAmount.objects.bulk_create(
+                IngredientRecipeAmount(
+                    recipe=recipe, ingredient=ingredients[(i + j) % 6],
+                    amount=j + 1
+                ) for j in range(3)
+            )
+        cls.user = cls.users[0]
+        Follow.objects.create(user=cls.user, author=cls.users[1])
+        cls.user.favorite_recipes.create(recipe=recipe)
+        cls.user.cart_recipes.create(recipe=recipe)
+        cls.recipe = recipe
+
+
+class RecipeQueryCountTest(RecipeDataTestCase):
+    """Количество SQL запросов списка и страницы рецепта не зависит от
+    размера страницы."""
+
+    def get_client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def assert_list_queries(self, user, expected):
+        client = self.get_client(user)
+        for limit in (1, 6, 20):
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = client.get('/api/recipes/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(None, 4)
+
+    def test_list_authenticated(self):
+        self.assert_list_queries(self.user, 4)
+
+    def test_detail(self):
+        for user in (None, self.user):
+            client = self.get_client(user)
+            with self.subTest(user=user), self.assertNumQueries(4):
+                response = client.get(f'/api/recipes/{self.recipe.pk}/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        path = '/api/recipes/'
+        for user, expected in ((None, 1), (self.user, 2)):
+            client = self.get_client(user)
+            etag = client.get(path)['ETag']
+            etag = client.get(path, HTTP_IF_NONE_MATCH=etag)['ETag']
+            with self.subTest(user=user), self.assertNumQueries(expected):
+                response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+
+class RecipeWriteQueryCountTest(TestCase):
+    """Количество SQL запросов создания и изменения рецепта не зависит от
+    количества ингредиентов."""
+    image = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAA'
+             'CQd1PeAAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def get_data(self, name, ingredients):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 10,
+            'image': self.image, 'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for amount, ingredient in enumerate(ingredients, 1)
+            ]
+        }
+
+    def test_create(self):
+        for count in (1, 5, 10):
+            data = self.get_data(f'Рецепт {count}', self.ingredients[:count])
+            with self.subTest(count=count), self.assertNumQueries(15):
+                response = self.client.post(
+                    '/api/recipes/', data, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()['ingredients']), count)
+
+    def test_update(self):
+        response = self.client.post('/api/recipes/', self.get_data(
+            'Рецепт', self.ingredients[:4]), format='json')
+        path = f'/api/recipes/{response.json()["id"]}/'
+        # Каждое изменение удаляет первый ингредиент, меняет количество
+        # оставшихся и добавляет новые.
+        for start, count in ((1, 5), (2, 10), (3, 20)):
+            data = self.get_data(
+                'Рецепт', self.ingredients[start:start + count])
+            del data['image']
+            with self.subTest(count=count), self.assertNumQueries(19):
+                response = self.client.patch(path, data, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['ingredients']), count)
+
+
+class SerializerParityTest(RecipeDataTestCase):
+    """Сериализаторы чтения отдают побайтно те же ответы, что и полные
+    сериализаторы."""
+
+    def get_content(self, viewset, action, path, params=None,
+                    serializer_class=None, **kwargs):
+        class View(viewset):
+            def get_serializer_class(self):
+                return serializer_class or super().get_serializer_class()
+
+        request = APIRequestFactory().get(path, params)
+        force_authenticate(request, self.user)
+        response = View.as_view({'get': action})(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.render().content
+
+    def assert_same(self, viewset, action, path, full_serializer,
+                    params=None, **kwargs):
+        self.assertEqual(
+            self.get_content(viewset, action, path, params, **kwargs),
+            self.get_content(viewset, action, path, params,
+                             full_serializer, **kwargs)
+        )
+
+    def test_recipe_list(self):
+        self.assert_same(RecipeViewSet, 'list', '/api/recipes/',
+                         serializers.FullRecipeSerializer, {'limit': 10})
+
+    def test_recipe_detail(self):
+        self.assert_same(RecipeViewSet, 'retrieve',
+                         f'/api/recipes/{self.recipe.pk}/',
+                         serializers.FullRecipeSerializer, pk=self.recipe.pk)
+
+    def test_subscriptions(self):
+        self.assert_same(UserViewSet, 'subscriptions',
+                         '/api/users/subscriptions/',
+                         serializers.SubscribeSerializer,
+                         {'recipes_limit': 2})
+
+    def test_me(self):
+        self.assert_same(UserViewSet, 'me', '/api/users/me/',
+                         serializers.UserSerializer)
+
+
+class RecipeConditionalGetTest(TestCase):
+    """ETag рецептов меняется при изменении данных автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', image='recipes/images/recipe.png',
+            text='Описание', cooking_time=10, author=cls.author
+        )
+
+    def get_etag(self, client, path):
+        """ETag по состоянию: его отдаёт ответ на условный запрос с ETag
+        по содержимому."""
+        etag = client.get(path)['ETag']
+        return client.get(path, HTTP_IF_NONE_MATCH=etag)['ETag']
+
+    def assert_author_change_modifies(self, path):
+        client = APIClient()
+        etag = self.get_etag(client, path)
+        self.assertEqual(
+            client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.author.first_name = 'Другое имя'
+        self.author.save()
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json().get('results', [response.json()])[0]['author'][
+                'first_name'],
+            'Другое имя'
+        )
+
+    def test_list(self):
+        self.assert_author_change_modifies('/api/recipes/')
+
+    def test_detail(self):
+        self.assert_author_change_modifies(f'/api/recipes/{self.recipe.pk}/')
+
+    def test_login_keeps_etag(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        client = APIClient()
+        etag = self.get_etag(client, path)
+        self.author.save(update_fields=('last_login',))
+        self.assertEqual(
+            client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ShoppingListDownloadTest(RecipeDataTestCase):
+    """Выгрузка списка покупок в каждом формате и ошибки выгрузки в
+    JSON."""
+    path = '/api/recipes/download_shopping_cart/'
+    rows = [
+        {'name': 'Ингредиент 0', 'measurement_unit': 'г', 'amount': 2},
+        {'name': 'Ингредиент 1', 'measurement_unit': 'г', 'amount': 3},
+        {'name': 'Ингредиент 5', 'measurement_unit': 'г', 'amount': 1},
+    ]
+    lines = ['Ингредиент 0(г)—2', 'Ингредиент 1(г)—3', 'Ингредиент 5(г)—1']
+
+    def download(self, user, **extra):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get(self.path, **extra)
+
+    def assert_download(self, response, content_type, extension):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{extension}"')
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        content = self.assert_download(
+            self.download(self.user, data={'format': 'txt'}),
+            'text/plain; charset=utf-8', 'txt')
+        self.assertEqual(content.decode(), ''.join(
+            f'{line}\n' for line in self.lines))
+
+    def test_csv(self):
+        content = self.assert_download(
+            self.download(self.user, HTTP_ACCEPT='text/csv'),
+            'text/csv; charset=utf-8', 'csv')
+        self.assertEqual(content.decode(), ''.join(
+            f'{row["name"]},{row["measurement_unit"]},{row["amount"]}\r\n'
+            for row in [{'name': 'name', 'measurement_unit':
+                         'measurement_unit', 'amount': 'amount'}, *self.rows]
+        ))
+
+    def test_json(self):
+        content = self.assert_download(
+            self.download(self.user, data={'format': 'json'}),
+            'application/json; charset=utf-8', 'json')
+        self.assertEqual(json.loads(content.decode()), self.rows)
+
+    def test_pdf_cyrillic(self):
+        content = self.assert_download(
+            self.download(self.user, data={'format': 'pdf'}),
+            'application/pdf', 'pdf')
+        self.assertTrue(content.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        # Кириллица записана в cp1251, байты сопоставлены глифам шрифта.
+        self.assertIn(b'/Differences [168 /afii10023 184 /afii10071 '
+                      b'192 /afii10017 ', content)
+        self.assertIn(b'/afii10096 /afii10097]', content)
+        self.assertIn(b'(%s) Tj' % 'Список покупок'.encode('cp1251'), content)
+        # Скобки экранированы, тире записано байтом 0x97 cp1251.
+        self.assertIn(
+            b'(\xc8\xed\xe3\xf0\xe5\xe4\xe8\xe5\xed\xf2 0\\(\xe3\\)\x972) Tj',
+            content)
+
+    def test_errors_in_json(self):
+        for format in ('txt', 'csv', 'json', 'pdf'):
+            for user, status_code, key in (
+                (None, 401, 'detail'), (self.users[1], 400, 'error')
+            ):
+                with self.subTest(format=format, user=user):
+                    response = self.download(user, data={'format': format})
+                    self.assertEqual(response.status_code, status_code)
+                    self.assertEqual(
+                        response['Content-Type'], 'application/json')
+                    self.assertNotIn('Content-Disposition', response)
+                    self.assertIn(key, response.json())
+
+
+class ORJSONRendererTest(SimpleTestCase):
+    """ORJSONRenderer выводит те же байты, что и JSONRenderer DRF."""
+    data = {
+        'name': 'Борщ \u2028 \u2029',
+        'created': datetime.datetime(
+            2023, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2023, 1, 2),
+        'time': datetime.time(3, 4, 5, 678901),
+        'items': [{'id': 1, 'amount': 1.5}, [], {}],
+    }
+
+    def assert_same(self, accepted_media_type, renderer_context=None):
+        self.assertEqual(
+            ORJSONRenderer().render(
+                self.data, accepted_media_type, renderer_context),
+            JSONRenderer().render(
+                self.data, accepted_media_type, renderer_context)
+        )
+
+    def test_compact(self):
+        self.assert_same('application/json')
+
+    def test_indent(self):
+        for indent in (0, 2, 4):
+            with self.subTest(indent=indent):
+                self.assert_same(f'application/json; indent={indent}')
+                self.assert_same('application/json', {'indent': indent})
+
+
+class BatchLinkTest(RecipeDataTestCase):
+    """Пакетные избранное, корзина и подписки: статус для каждого id,
+    проверка списка ids, списки покупок и ленты после изменения."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, path, ids):
+        response = getattr(self.client, method)(
+            path, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assert_statuses(self, results, expected):
+        """expected — пары (id, статус) или (id, статус, ошибка)."""
+        self.assertEqual([(row['id'], row['status']) for row in results],
+                         [row[:2] for row in expected])
+        for row, (*_, error) in zip(results, expected):
+            with self.subTest(id=row['id']):
+                if row['status'] == 400:
+                    self.assertEqual(row['error'], error)
+                elif row['status'] == 404:
+                    self.assertIn('detail', row)
+
+    def recipe_ids(self, *numbers):
+        ids = list(Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        return [ids[number] for number in numbers]
+
+    def test_favorite(self):
+        first, second, last = self.recipe_ids(0, 1, -1)
+        path = '/api/recipes/favorite/'
+        ids = [first, last, 0x7fff, first]
+        self.assert_statuses(self.send('post', path, ids), [
+            (first, 201, None),
+            (last, 400, 'Рецепт уже находится в списке избранного.'),
+            (0x7fff, 404, None),
+        ])
+        self.assertEqual(set(self.user.favorite_recipes.values_list(
+            'recipe_id', flat=True)), {first, last})
+        ids = [first, second, 0x7fff]
+        self.assert_statuses(self.send('delete', path, ids), [
+            (first, 204, None),
+            (second, 400, 'Рецепт не в списке избранного.'),
+            (0x7fff, 404, None),
+        ])
+        self.assertEqual(set(self.user.favorite_recipes.values_list(
+            'recipe_id', flat=True)), {last})
+
+    def test_shopping_cart_totals(self):
+        path = '/api/recipes/shopping_cart/'
+        added = self.recipe_ids(0, 1, 2, 6)
+        last, = self.recipe_ids(-1)
+        self.assert_statuses(self.send('post', path, [*added, last]), [
+            *((pk, 201, None) for pk in added),
+            (last, 400, 'Рецепт уже находится в корзине.'),
+        ])
+        self.assertEqual(stored_shopping_lists([self.user.pk]),
+                         live_shopping_lists([self.user.pk]))
+        self.assert_statuses(self.send('delete', path, [added[0], last]), [
+            (added[0], 204, None), (last, 204, None)])
+        self.assertEqual(stored_shopping_lists([self.user.pk]),
+                         live_shopping_lists([self.user.pk]))
+        self.assertEqual(set(self.user.cart_recipes.values_list(
+            'recipe_id', flat=True)), set(added[1:]))
+
+    def test_subscribe(self):
+        path = '/api/users/subscribe/'
+        author, followed = self.users[2], self.users[1]
+        self.assert_statuses(self.send('post', path, [
+            author.pk, self.user.pk, followed.pk, 0x7fff]), [
+            (author.pk, 201, None),
+            (self.user.pk, 400, 'Нельзя подписаться на себя.'),
+            (followed.pk, 400, 'Автор уже находится в списке подписок.'),
+            (0x7fff, 404, None),
+        ])
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(
+            set(FeedItem.objects.filter(
+                user=self.user, author=author).values_list(
+                'recipe_id', flat=True)),
+            set(author.recipes.values_list('pk', flat=True))
+        )
+        self.assert_statuses(self.send('delete', path, [author.pk]), [
+            (author.pk, 204, None)])
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+        self.assertFalse(FeedItem.objects.filter(
+            user=self.user, author=author).exists())
+
+    def test_invalid_ids(self):
+        for path in ('/api/recipes/favorite/', '/api/recipes/shopping_cart/',
+                     '/api/users/subscribe/'):
+            for method in ('post', 'delete'):
+                for data in ({}, {'ids': []}, {'ids': [0]}, {'ids': ['a']},
+                             {'ids': list(range(1, 102))}):
+                    with self.subTest(path=path, method=method, data=data):
+                        response = getattr(self.client, method)(
+                            path, data, format='json')
+                        self.assertEqual(response.status_code, 400)
+                        self.assertIn('ids', response.json())
+
+    def test_max_ids(self):
+        results = self.send('delete', '/api/recipes/favorite/',
+                            list(range(1, 101)))
+        self.assertEqual(len(results), 100)
+
+    def test_anonymous(self):
+        response = APIClient().post(
+            '/api/recipes/favorite/', {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class SerializerTimingTest(RecipeDataTestCase):
+    """Время сериализации замеряется у сериализаторов представлений, без
+    изменения классов DRF."""
+
+    @override_settings(API_METRICS_ENABLED=True)
+    def test_recorded(self):
+        histogram = metrics.histograms['serializer_time']
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for path, view in (
+            (f'/api/recipes/{self.recipe.pk}/', 'RecipeViewSet.retrieve'),
+            ('/api/recipes/', 'RecipeViewSet.list'),
+            ('/api/users/me/', 'UserViewSet.me'),
+        ):
+            with self.subTest(view=view):
+                count = histogram.counts.get(view, [0])[-1]
+                total = histogram.sums[view]
+                self.assertEqual(client.get(path).status_code, 200)
+                self.assertEqual(histogram.counts[view][-1], count + 1)
+                self.assertGreater(histogram.sums[view], total)
+
+    def test_timed_class(self):
+        timed_class = get_timed_class(serializers.RecipeReadSerializer)
+        self.assertTrue(
+            issubclass(timed_class, serializers.RecipeReadSerializer))
+        self.assertIs(get_timed_class(serializers.RecipeReadSerializer),
+                      timed_class)
+        self.assertIs(get_timed_class(timed_class), timed_class)
+        self.assertNotIsInstance(
+            serializers.RecipeReadSerializer(self.recipe), TimedDataMixin)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Одновременные запросы проверяются на PostgreSQL.')
+class ToggleConcurrencyTest(TransactionTestCase):
+    """Из одновременных запросов добавления или удаления одной пары
+    пару изменяет ровно один, остальные получают 400, а не 500."""
+    threads = 8
+
+    def setUp(self):
+        self.user, self.author = (
+            User.objects.create_user(
+                email=f'{name}@foodgram.ru', username=name,
+                first_name='Имя', last_name='Фамилия', password='Pass12345!'
+            ) for name in ('user', 'author')
+        )
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', image='recipes/images/recipe.png',
+            text='Описание', cooking_time=10, author=self.author
+        )
+        IngredientRecipeAmount.objects.create(
+            recipe=self.recipe, amount=3,
+            ingredient=Ingredient.objects.create(
+                name='Ингредиент', measurement_unit='г')
+        )
+
+    def hammer(self, method, path):
+        """Отсортированные статусы ответов на одновременные запросы."""
+        barrier = threading.Barrier(self.threads)
+
+        def send(_):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(path).status_code
+            except Exception:
+                return 500
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            return sorted(executor.map(send, range(self.threads)))
+
+    def assert_toggles(self, path, links):
+        for method, success, count in (('post', 201, 1), ('delete', 204, 0)):
+            with self.subTest(method=method):
+                self.assertEqual(
+                    self.hammer(method, path),
+                    sorted([success] + [400] * (self.threads - 1))
+                )
+                self.assertEqual(links.count(), count)
+
+    def test_favorite(self):
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            FavoriteRecipe.objects.filter(user=self.user, recipe=self.recipe)
+        )
+
+    def test_shopping_cart(self):
+        self.assert_toggles(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            ShoppingCart.objects.filter(user=self.user, recipe=self.recipe)
+        )
+        self.assertEqual(live_shopping_lists([self.user.pk]),
+                         stored_shopping_lists([self.user.pk]))
+
+    def test_subscribe(self):
+        self.assert_toggles(
+            f'/api/users/{self.author.pk}/subscribe/',
+            Follow.objects.filter(user=self.user, author=self.author)
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
@@ -15,6 +15,7 @@ router.register('users', UserViewSet, basename='user')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('_metrics/', views.MetricsView.as_view(), name='metrics'),
     path('auth/', include([
         re_path(r"^token/login/?$",
                 TokenCreateView.as_view(), name="login"),
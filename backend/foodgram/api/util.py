@@ -1,28 +1,132 @@
-from django.db.models import Q
+from django.db import connection, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 
+from api.serializers import BatchSerializer
 
-def add_or_del_obj(request, q, model_fk, model_m2m,
-                   serializer, error_message, id):
-    obj = get_object_or_404(model_fk, pk=id)
-    obj_exists = model_m2m.objects.filter(
-        Q(user=request.user) & q)
+
+def link_columns(model, field):
+    """Таблица и столбцы пользователя и объекта в таблице связей."""
+    quote_name = connection.ops.quote_name
+    return (quote_name(model._meta.db_table),
+            quote_name(model._meta.get_field('user').column),
+            quote_name(model._meta.get_field(field).column))
+
+
+def insert_links(model, user_id, field, ids):
+    """Создаёт связи пользователя с объектами ids одним INSERT ... ON
+    CONFLICT DO NOTHING и возвращает id объектов, связи с которыми
+    созданы этим запросом."""
+    if not ids:
+        return []
+    table, user_column, column = link_columns(model, field)
+    values = ', '.join(['(%s, %s)'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING RETURNING {column}',
+            [value for pk in ids for value in (user_id, pk)]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_links(model, user_id, field, ids):
+    """Удаляет связи пользователя с объектами ids одним DELETE и
+    возвращает id объектов, связи с которыми удалены этим запросом."""
+    if not ids:
+        return []
+    table, user_column, column = link_columns(model, field)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {user_column} = %s '
+            f'AND {column} IN ({placeholders}) RETURNING {column}',
+            [user_id, *ids]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+@transaction.atomic
+def change_links(model, user_id, field, ids, adding, hook=None):
+    """Создаёт или удаляет связи и возвращает id объектов, для которых
+    связь изменена. Одновременные запросы с одной парой не приводят к
+    IntegrityError: изменение выполняет только один из них. Запросы не
+    отправляют сигналы, их работу выполняет hook(user_id, ids) для
+    изменённых связей."""
+    changed = (insert_links if adding else delete_links)(
+        model, user_id, field, ids)
+    if changed and hook is not None:
+        hook(user_id, changed)
+    return changed
+
+
+def add_or_del_obj(request, field, model_fk, model_m2m, serializer,
+                   error_message, id, on_add=None, on_delete=None):
+    """Добавляет (POST) или удаляет связь пользователя с объектом id.
+    Если связь уже есть или её нет, отвечает ошибкой из
+    error_message."""
+    user_id = request.user.id
     if request.method == 'POST':
-        if obj_exists:
+        obj = get_object_or_404(model_fk, pk=id)
+        if not change_links(model_m2m, user_id, field, [obj.pk], True,
+                            on_add):
             return Response(
                 error_message['error_create_obj'],
                 status=status.HTTP_400_BAD_REQUEST
             )
-        model_m2m(None, request.user.id, obj.id).save()
         return Response(
-            serializer(obj, context={'request': request}).data
+            serializer(obj, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
         )
-    if obj_exists:
-        obj_exists.delete()
+    if change_links(model_m2m, user_id, field, [int(id)], False, on_delete):
         return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(model_fk, pk=id)
     return Response(
         error_message['error_del_obj'],
         status=status.HTTP_400_BAD_REQUEST
     )
+
+
+def batch_statuses(ids, found, changed, adding, error_message, invalid):
+    """Статус и ошибка для каждого id, как у add_or_del_obj."""
+    results = []
+    for pk in ids:
+        if pk not in found:
+            results.append({'id': pk, 'status': status.HTTP_404_NOT_FOUND,
+                            'detail': NotFound.default_detail})
+        elif pk in invalid:
+            results.append({'id': pk, 'status': status.HTTP_400_BAD_REQUEST,
+                            **invalid[pk]})
+        elif pk not in changed:
+            key = 'error_create_obj' if adding else 'error_del_obj'
+            results.append({'id': pk, 'status': status.HTTP_400_BAD_REQUEST,
+                            **error_message[key]})
+        else:
+            results.append({'id': pk, 'status': (
+                status.HTTP_201_CREATED if adding
+                else status.HTTP_204_NO_CONTENT
+            )})
+    return results
+
+
+def add_or_del_objs(request, model_fk, model_m2m, field, error_message,
+                    on_add=None, on_delete=None, invalid=None):
+    """Пакетный вариант add_or_del_obj для списка id из тела запроса:
+    объекты проверяются одним запросом, связи создаются или удаляются
+    другим. invalid — ошибки для id, которые нельзя использовать."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    invalid = invalid or {}
+    adding = request.method == 'POST'
+    found = set(
+        model_fk.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    changed = change_links(
+        model_m2m, request.user.id, field,
+        [pk for pk in ids if pk in found and pk not in invalid],
+        adding, on_add if adding else on_delete
+    )
+    return Response(batch_statuses(
+        ids, found, set(changed), adding, error_message, invalid))
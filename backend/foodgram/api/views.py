@@ -1,19 +1,49 @@
-from django.db.models import Sum, Q
-from django.http import HttpResponse
+from django.db.models import Count, Exists, F, Max, OuterRef, Subquery
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from api import serializers
-from api.filters import RecipeFilter, IngredientFilter
-from api.pagination import PageLimitPagination
+from api.cache import ConditionalGetMixin, VersionedCacheMixin
+from api.fieldsets import SparseFieldsMixin
+from api.filters import RecipeFilter
+from api.metrics import SerializerTimingMixin, metrics
+from api.pagination import KeysetPagination, PageOrCursorPagination
 from api.permissions import AdminOrReadOnly, AuthorAdminOrReadOnly
-from api.util import add_or_del_obj
+from api.renderers import (ORJSONRenderer, PrometheusRenderer,
+                           SHOPPING_LIST_RENDERERS)
+from api.util import add_or_del_obj, add_or_del_objs
 from recipes import models
+from recipes.search import ingredient_index
+from recipes.utils import (add_recipes_to_shopping_list,
+                           remove_recipes_from_shopping_list)
+from user.models import Follow, User
 
 
-class TagViewSet(viewsets.ModelViewSet):
+FAVORITE_ERRORS = {
+    'error_create_obj':
+    {'error': 'Рецепт уже находится в списке избранного.'},
+    'error_del_obj':
+    {'error': 'Рецепт не в списке избранного.'}
+}
+
+SHOPPING_CART_ERRORS = {
+    'error_create_obj':
+    {'error': 'Рецепт уже находится в корзине.'},
+    'error_del_obj':
+    {'error': 'Рецепт не находится в корзине.'}
+}
+
+EMPTY_SHOPPING_LIST_ERROR = {'error': 'Список покупок пуст.'}
+
+
+class TagViewSet(SerializerTimingMixin, VersionedCacheMixin,
+                 viewsets.ModelViewSet):
     """Получает список тегов."""
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
@@ -22,31 +52,107 @@ class TagViewSet(viewsets.ModelViewSet):
     # На уровне проекта не переопределялся класс пагинации по умолчанию.
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
-    """Получает список ингредиентов."""
+class IngredientViewSet(SerializerTimingMixin, VersionedCacheMixin,
+                        viewsets.ModelViewSet):
+    """Получает список ингредиентов, поиск по названию выполняется
+    индексом в памяти: сначала совпадения по началу названия, затем
+    по подстроке."""
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
 
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get('name')
+        if self.action == 'list' and name:
+            return ingredient_index.search(name)
+        return super().filter_queryset(queryset)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                    SparseFieldsMixin, viewsets.ModelViewSet):
     """Создаёт и получает список рецептов, также добавляет их в
     корзину и список избранного."""
     queryset = models.Recipe.objects.all()
     serializer_class = serializers.FullRecipeSerializer
     permission_classes = (AuthorAdminOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = PageOrCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return models.Recipe.objects.with_related(
+            self.request.user,
+            fields=self.get_sparse_fields(),
+            expand=self.get_expanded_fields()
+        )
+
+    def get_serializer_class(self):
+        # Браузерная версия API строит формы в действиях чтения с
+        # подменённым методом запроса, им нужен полный сериализатор.
+        if (self.action in ('list', 'retrieve', 'feed')
+                and self.request.method in SAFE_METHODS):
+            return serializers.RecipeReadSerializer
+        return self.serializer_class
+
+    def get_flags_state(self):
+        """Состояние избранного, корзины и подписок пользователя одним
+        запросом: количество и последний id в каждой таблице."""
+        user = self.request.user
+        if user.is_anonymous:
+            return None
+        relations = {
+            'favorites': models.FavoriteRecipe,
+            'cart': models.ShoppingCart,
+            'follows': Follow,
+        }
+        state = {}
+        for name, model in relations.items():
+            rows = model.objects.filter(
+                user=OuterRef('pk')).order_by().values('user')
+            state[f'{name}_count'] = Subquery(
+                rows.annotate(value=Count('id')).values('value'))
+            state[f'{name}_last'] = Subquery(
+                rows.annotate(value=Max('id')).values('value'))
+        return User.objects.filter(pk=user.pk).values(**state).first()
+
+    def get_condition(self):
+        """Анонимным пользователям ответ зависит только от рецептов,
+        поэтому для них отдаётся и Last-Modified. Для остальных в ETag
+        входит состояние избранного, корзины и подписок."""
+        user = self.request.user
+        if self.action == 'retrieve':
+            pk = str(self.kwargs.get(self.lookup_field, ''))
+            if not pk.isdecimal():
+                return None
+            recipe = models.Recipe.objects.with_user_flags(user).annotate(
+                is_subscribed=Exists(Follow.objects.filter(
+                    user=user.pk, author=OuterRef('author')))
+            ).filter(pk=pk).values(
+                'updated', 'is_favorited', 'is_in_shopping_cart',
+                'is_subscribed'
+            ).first()
+            if recipe is None:
+                return None
+            last_modified = recipe['updated']
+        else:
+            recipe = self.filter_queryset(
+                models.Recipe.objects.all()
+            ).aggregate(count=Count('id'), updated=Max('updated'))
+            last_modified = recipe['updated']
+            recipe['flags'] = self.get_flags_state()
+        if user.is_authenticated:
+            return (user.pk, recipe), None
+        return recipe, last_modified
+
     def get_permissions(self):
         if self.action in (
             'favorite',
+            'favorite_batch',
             'shopping_cart',
-            'download_shopping_cart'
+            'shopping_cart_batch',
+            'download_shopping_cart',
+            'feed'
         ):
             self.permission_classes = (IsAuthenticated,)
         return super().get_permissions()
@@ -54,58 +160,96 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Рендереры выгрузки умеют только потоковый список покупок:
+        # ошибки, включая отказ в доступе, отдаются в JSON.
+        if (self.action == 'download_shopping_cart'
+                and isinstance(response, Response)
+                and response.status_code >= status.HTTP_400_BAD_REQUEST):
+            request.accepted_renderer = ORJSONRenderer()
+            request.accepted_media_type = ORJSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    @action(['get'], detail=False, pagination_class=KeysetPagination)
+    def feed(self, request, *args, **kwargs):
+        """Рецепты авторов, на которых подписан пользователь, от новых к
+        старым."""
+        page = self.paginate_queryset(
+            self.get_queryset().feed(request.user))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(['post', 'delete'], detail=False,
             url_path=r'(?P<recipe_id>\d+)/favorite')
     def favorite(self, request, recipe_id):
         """Добавить или удалить из избранного
         post добавляет, delete убирает из этого списка."""
-        error_message = {
-            'error_create_obj':
-            {'error': 'Рецепт уже находится в списке избранного.'},
-            'error_del_obj':
-            {'error': 'Рецепт не в списке избранного.'}
-        }
         serializer = serializers.RecipeSerializer
-        return add_or_del_obj(request, Q(recipe__id=recipe_id),
+        return add_or_del_obj(request, 'recipe',
                               models.Recipe, models.FavoriteRecipe,
-                              serializer, error_message, recipe_id)
+                              serializer, FAVORITE_ERRORS, recipe_id)
+
+    @action(['post', 'delete'], detail=False, url_path='favorite',
+            serializer_class=serializers.BatchSerializer)
+    def favorite_batch(self, request):
+        """Добавить или удалить из избранного рецепты из списка ids,
+        для каждого рецепта возвращается статус."""
+        return add_or_del_objs(request, models.Recipe, models.FavoriteRecipe,
+                               'recipe', FAVORITE_ERRORS)
 
     @action(['post', 'delete'], detail=False,
             url_path=r'(?P<recipe_id>\d+)/shopping_cart')
     def shopping_cart(self, request, recipe_id):
-        error_message = {
-            'error_create_obj':
-            {'error': 'Рецепт уже находится в корзине.'},
-            'error_del_obj':
-            {'error': 'Рецепт не находится в корзине.'}
-        }
         serializer = serializers.RecipeSerializer
-        return add_or_del_obj(request, Q(recipe__id=recipe_id),
+        return add_or_del_obj(request, 'recipe',
                               models.Recipe, models.ShoppingCart,
-                              serializer, error_message, recipe_id)
+                              serializer, SHOPPING_CART_ERRORS, recipe_id,
+                              on_add=add_recipes_to_shopping_list,
+                              on_delete=remove_recipes_from_shopping_list)
+
+    @action(['post', 'delete'], detail=False, url_path='shopping_cart',
+            serializer_class=serializers.BatchSerializer)
+    def shopping_cart_batch(self, request):
+        """Добавить или удалить из корзины рецепты из списка ids, для
+        каждого рецепта возвращается статус."""
+        return add_or_del_objs(
+            request, models.Recipe, models.ShoppingCart, 'recipe',
+            SHOPPING_CART_ERRORS,
+            on_add=add_recipes_to_shopping_list,
+            on_delete=remove_recipes_from_shopping_list
+        )
 
-    @action(['get'], detail=False)
+    @action(['get'], detail=False,
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request, *args, **kwargs):
+        """Выгружает список покупок потоком в формате, выбранном
+        параметром format (txt, csv, json, pdf) или заголовком Accept."""
         user = request.user
         if not models.ShoppingCart.objects.filter(user=user).exists():
-            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
-        file_content = []
-        shopping_list = models.Ingredient.objects.filter(
-            recipes__user_cart__user=user).values(
-            'name',
-            'measurement_unit'
-        ).annotate(
-            amount=Sum('ingredientrecipeamount__amount')
-        ).order_by('name')
-        for ingredients in shopping_list:
-            file_content.append(
-                f'{ingredients["name"]}'
-                f'({ingredients["measurement_unit"]})—'
-                f'{ingredients["amount"]}'
-            )
-        file_content = '\n'.join(file_content)
-        response = HttpResponse(file_content,
-                                content_type='text.txt')
+            return Response(EMPTY_SHOPPING_LIST_ERROR,
+                            status=status.HTTP_400_BAD_REQUEST)
+        shopping_list = models.ShoppingListItem.objects.filter(
+            user=user).annotate(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).values('name', 'measurement_unit', 'amount').order_by('name')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_list.iterator()),
+            content_type=renderer.get_content_type()
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"')
+            f'attachment; filename="shopping_list.{renderer.format}"')
         return response
+
+
+class MetricsView(APIView):
+    """Отдаёт метрики запросов текущего процесса в формате Prometheus."""
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            metrics.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
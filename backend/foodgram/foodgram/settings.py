@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'api.apps.ApiConfig',
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +88,44 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# По умолчанию файловый кэш, общий для воркеров gunicorn и команд
+# manage.py в контейнере. Кэш в памяти процесса (LocMemCache) не видит
+# изменений из других процессов, поэтому с ним кэш ответов API
+# отключается. Для нескольких контейнеров укажите совместимый с Redis
+# бэкенд, например django_redis.cache.RedisCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    }
+}
+
+API_CACHE_ALIAS = 'default'
+# Время жизни ответов в кэше, секунд.
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=5 * 60))
+
+# Кэш пользователей по токену. Без TOKEN_CACHE_ALIAS используется LRU в
+# памяти процесса, и выход или смена пароля в другом процессе видны
+# здесь через TOKEN_CACHE_TTL секунд.
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS') or None
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=30))
+
+# Метрики запросов: количество и время SQL, время сериализации.
+# Гистограммы хранятся в памяти процесса и доступны по /api/_metrics/.
+API_METRICS_ENABLED = os.getenv('API_METRICS_ENABLED', 'True') == 'True'
+# Количество SQL запросов, после которого запрос попадает в лог.
+API_QUERY_BUDGET = int(os.getenv('API_QUERY_BUDGET', default=20))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -103,6 +144,35 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Алгоритм хэширования паролей: argon2, bcrypt (требует пакет bcrypt)
+# или pbkdf2. Хэши других алгоритмов из списка проверяются и
+# пересчитываются выбранным при входе пользователя.
+PASSWORD_HASHER_CLASSES = {
+    'argon2': 'user.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'user.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', default='argon2')
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CLASSES[PASSWORD_HASHER],
+    *(path for name, path in PASSWORD_HASHER_CLASSES.items()
+      if name != PASSWORD_HASHER),
+]
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', default=2))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', default=19 * 1024))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', default=1))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', default=12))
+
+AUTHENTICATION_BACKENDS = ['user.backends.EmailBackend']
+
+# Одновременных попыток входа с одного IP и для одного email. Для email
+# допускается повторная отправка формы входа.
+LOGIN_CONCURRENCY_PER_IP = int(
+    os.getenv('LOGIN_CONCURRENCY_PER_IP', default=4))
+LOGIN_CONCURRENCY_PER_EMAIL = int(
+    os.getenv('LOGIN_CONCURRENCY_PER_EMAIL', default=2))
+LOGIN_GUARD_TIMEOUT = 30
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -110,8 +180,24 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-    ]
+        'user.authentication.CachedTokenAuthentication',
+    ],
+
+    # Браузерная версия API доступна только при DEBUG.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
+    # Число прокси перед приложением: IP клиента берётся из
+    # X-Forwarded-For, дописанного nginx, а не из заголовка клиента.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', default=1)),
 }
 
 
@@ -145,6 +231,25 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Время жизни индекса поиска ингредиентов в памяти процесса, в секундах.
+# Сигналы сбрасывают индекс только в процессе, изменившем ингредиенты.
+INGREDIENT_SEARCH_INDEX_TTL = int(
+    os.getenv('INGREDIENT_SEARCH_INDEX_TTL', default=300))
+
+# Рецепты авторов, у которых подписчиков не больше этого числа,
+# раскладываются по лентам при публикации, остальные читаются из таблицы
+# рецептов при запросе ленты.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+# Количество потоков, раскладывающих по лентам рецепты автора, у
+# которого подписчиков стало не больше FEED_FANOUT_LIMIT. При 0 рецепты
+# раскладываются в запросе сразу после фиксации транзакции.
+FEED_BACKFILL_WORKERS = int(os.getenv('FEED_BACKFILL_WORKERS', default=1))
+
+# Количество потоков, создающих копии изображений рецептов. При 0
+# копии создаются в запросе сразу после фиксации транзакции.
+IMAGE_PROCESSING_WORKERS = int(
+    os.getenv('IMAGE_PROCESSING_WORKERS', default=2))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -170,5 +275,10 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "rebuild_shopping_lists": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
 from recipes import models
+from recipes.search import update_search_vectors
+from recipes.utils import rebuild_shopping_lists
 
 
 class IngredientInline(admin.TabularInline):
@@ -31,6 +33,14 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('author', 'name', 'tags')
     inlines = (IngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vectors(
+            models.Recipe.objects.filter(pk=form.instance.pk))
+        if change:
+            rebuild_shopping_lists(
+                form.instance.user_cart.values_list('user_id', flat=True))
+
     @admin.display(description='Добавлен в избранное')
     def count_favorite(self, obj):
         return obj.favoriterecipe_set.count()
@@ -0,0 +1,125 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FeedItem, Recipe
+from user.models import Follow, User
+
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.FEED_BACKFILL_WORKERS),
+    thread_name_prefix='recipe-feeds'
+)
+
+
+def insert_feed_items(condition, params):
+    """Раскладывает рецепты авторов, у которых подписчиков не больше
+    FEED_FANOUT_LIMIT, по лентам подписчиков одним INSERT ... SELECT.
+    condition ограничивает подписки follow и рецепты recipe, уже
+    разложенные рецепты пропускаются."""
+    quote_name = connection.ops.quote_name
+    feed_table = quote_name(FeedItem._meta.db_table)
+    follow_table = quote_name(Follow._meta.db_table)
+    recipe_table = quote_name(Recipe._meta.db_table)
+    user_table = quote_name(User._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {feed_table} (user_id, recipe_id, author_id) '
+            f'SELECT follow.user_id, recipe.id, recipe.author_id '
+            f'FROM {follow_table} follow '
+            f'JOIN {recipe_table} recipe '
+            f'ON recipe.author_id = follow.author_id '
+            f'JOIN {user_table} author ON author.id = follow.author_id '
+            f'WHERE author.followers_count <= %s AND {condition} '
+            f'ON CONFLICT DO NOTHING',
+            (settings.FEED_FANOUT_LIMIT, *params)
+        )
+        return cursor.rowcount
+
+
+def fan_out_recipe(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    return insert_feed_items('recipe.id = %s', (recipe.pk,))
+
+
+def backfill_author_feeds(author_id):
+    """Раскладывает все рецепты автора по лентам всех подписчиков."""
+    return insert_feed_items('follow.author_id = %s', (author_id,))
+
+
+def run_backfill_job(author_id):
+    try:
+        backfill_author_feeds(author_id)
+    except Exception:
+        logger.exception(
+            f'Не удалось заполнить ленты рецептами автора {author_id}.')
+    finally:
+        connections.close_all()
+
+
+def schedule_feed_backfill(author_id):
+    """Ставит заполнение лент рецептами автора в очередь после фиксации
+    транзакции. Без потоков заполнение выполняется сразу после
+    фиксации. Задачи, не выполненные до остановки процесса,
+    восстанавливает команда rebuild_feeds."""
+    if settings.FEED_BACKFILL_WORKERS:
+        transaction.on_commit(
+            lambda: executor.submit(run_backfill_job, author_id))
+    else:
+        transaction.on_commit(lambda: backfill_author_feeds(author_id))
+
+
+@transaction.atomic
+def follow_author(user_id, author_id):
+    """Учитывает новую подписку и заполняет ленту подписчика."""
+    User.objects.filter(pk=author_id).update(
+        followers_count=F('followers_count') + 1)
+    insert_feed_items('follow.user_id = %s AND follow.author_id = %s',
+                      (user_id, author_id))
+
+
+@transaction.atomic
+def unfollow_author(user_id, author_id):
+    """Учитывает отписку и убирает рецепты автора из ленты."""
+    User.objects.filter(pk=author_id, followers_count__gt=0).update(
+        followers_count=F('followers_count') - 1)
+    FeedItem.objects.filter(user=user_id, author=author_id).delete()
+    # Рецепты, опубликованные, пока подписчиков было больше порога, не
+    # разложены по лентам. Когда автор возвращается под порог, они
+    # раскладываются вне запроса: подписчиков может быть до
+    # FEED_FANOUT_LIMIT, а рецептов — сколько угодно.
+    if User.objects.filter(
+            pk=author_id,
+            followers_count=settings.FEED_FANOUT_LIMIT).exists():
+        schedule_feed_backfill(author_id)
+
+
+def follow_authors(user_id, author_ids):
+    """follow_author для каждой подписки, созданной массовой вставкой,
+    которая не отправляет сигналы."""
+    for author_id in author_ids:
+        follow_author(user_id, author_id)
+
+
+def unfollow_authors(user_id, author_ids):
+    """unfollow_author для каждой подписки, удалённой одним запросом
+    без сигналов."""
+    for author_id in author_ids:
+        unfollow_author(user_id, author_id)
+
+
+@transaction.atomic
+def rebuild_feeds():
+    """Пересчитывает количество подписчиков и пересобирает ленты."""
+    User.objects.update(followers_count=Coalesce(Subquery(
+        Follow.objects.filter(author=OuterRef('pk')).order_by().values(
+            'author').annotate(count=Count('pk')).values('count')
+    ), 0))
+    FeedItem.objects.all().delete()
+    return insert_feed_items('TRUE', ())
@@ -0,0 +1,84 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+# Копии изображения рецепта: наибольшая сторона в пикселях.
+VARIANTS = {
+    'thumbnail': 480,
+    'preview': 1280,
+}
+WEBP_QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.IMAGE_PROCESSING_WORKERS),
+    thread_name_prefix='recipe-images'
+)
+
+
+def variant_field(variant):
+    return Recipe._meta.get_field(f'image_{variant}')
+
+
+def render_variant(image, size):
+    """Уменьшенная копия изображения в формате WebP."""
+    copy = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    copy.thumbnail((size, size))
+    buffer = io.BytesIO()
+    copy.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    """Создаёт копии изображения рецепта. Имена файлов строятся по
+    содержимому оригинала, поэтому готовые копии не пересоздаются."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    names = {}
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        for variant, size in VARIANTS.items():
+            field = variant_field(variant)
+            name = field.generate_filename(recipe, f'{digest}_{size}.webp')
+            if not field.storage.exists(name):
+                name = field.storage.save(
+                    name, ContentFile(render_variant(image, size)))
+            names[field.attname] = name
+    # Изображение могло смениться, пока создавались копии.
+    Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+        updated=timezone.now(), **names)
+
+
+def run_image_job(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception(
+            f'Не удалось обработать изображение рецепта {recipe_id}.')
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку изображения в очередь после фиксации
+    транзакции. Без потоков обработки выполняется сразу."""
+    if settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(
+            lambda: executor.submit(run_image_job, recipe_id))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
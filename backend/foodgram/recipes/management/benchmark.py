@@ -0,0 +1,26 @@
+import time
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    index = round(percent / 100 * (len(values) - 1))
+    return values[index]
+
+
+def measure(function, arguments):
+    """Время выполнения function для каждого аргумента, в мс."""
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """p50, p95 и p99 времени выполнения в мс."""
+    return {
+        f'p{percent}_ms': round(percentile(timings, percent), 3)
+        for percent in (50, 95, 99)
+    }
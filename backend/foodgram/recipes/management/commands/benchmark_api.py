@@ -0,0 +1,178 @@
+import base64
+import io
+import itertools
+import json
+import subprocess
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.management.benchmark import percentile, summarize
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Tag)
+from user.models import Follow, User
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (40, 120, 200)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные сценарии API через тестовый клиент DRF и '
+            'сохраняет пропускную способность, p50/p95/p99 и количество '
+            'SQL запросов в JSON отчёт. Данные создаёт команда '
+            'seed_benchmark_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество запросов в каждом сценарии.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Количество неучитываемых запросов.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс пользователей seed_benchmark_data.')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Путь к JSON отчёту.')
+
+    def get_user(self, prefix):
+        user = User.objects.filter(
+            username__startswith=f'{prefix}_',
+            cart_recipes__isnull=False,
+            follower__isnull=False,
+            favorite_recipes__isnull=False
+        ).order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет данных для проверки, выполните seed_benchmark_data.')
+        return user
+
+    def get_list_scenarios(self, user):
+        # Значения фильтров берутся из корзины пользователя, чтобы их
+        # сочетания возвращали непустые страницы.
+        recipe = Recipe.objects.filter(user_cart__user=user).first()
+        filters = {
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'author': recipe.author_id,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+            'search': recipe.name.split()[0],
+        }
+        for size in range(len(filters) + 1):
+            for names in itertools.combinations(filters, size):
+                params = {'page': 1, 'limit': 6}
+                params.update((name, filters[name]) for name in names)
+                yield (f'recipes.list[{",".join(names)}]', 'get',
+                       '/api/recipes/', params)
+
+    def get_scenarios(self, user):
+        recipe = Recipe.objects.first()
+        ingredients = list(Ingredient.objects.values_list('pk', 'name')[:5])
+        yield from self.get_list_scenarios(user)
+        yield ('recipes.detail', 'get', f'/api/recipes/{recipe.pk}/', {})
+        yield ('recipes.feed', 'get', '/api/recipes/feed/', {'limit': 6})
+        yield ('users.subscriptions', 'get', '/api/users/subscriptions/',
+               {'page': 1, 'limit': 6, 'recipes_limit': 3})
+        yield ('recipes.download_shopping_cart', 'get',
+               '/api/recipes/download_shopping_cart/', {})
+        yield ('ingredients.search', 'get', '/api/ingredients/',
+               {'name': ingredients[0][1][:3]})
+        # Название рецепта уникально, поэтому данные строятся на каждый
+        # запрос.
+        yield ('recipes.create', 'post', '/api/recipes/', lambda: {
+            'name': f'Замер {uuid.uuid4().hex}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': get_image(),
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'ingredients': [
+                {'id': pk, 'amount': 100} for pk, name in ingredients],
+        })
+
+    def request(self, client, method, path, params):
+        if callable(params):
+            params = params()
+        if method == 'get':
+            response = client.get(path, params)
+        else:
+            response = client.post(path, params, format='json')
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {path}: {response.status_code} '
+                f'{response.content[:200]!r}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def run_scenario(self, client, method, path, params, repeat, warmup):
+        created = []
+        timings = []
+        queries = []
+        for index in range(warmup + repeat):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = self.request(client, method, path, params)
+                elapsed = time.perf_counter() - started
+            if method == 'post':
+                created.append(response.data['id'])
+            if index >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context.captured_queries))
+        for recipe in Recipe.objects.filter(pk__in=created):
+            recipe.image.delete(save=False)
+            recipe.delete()
+        return {
+            'requests': repeat,
+            'throughput_rps': round(repeat * 1000 / sum(timings), 1),
+            **summarize(timings),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': max(queries),
+        }
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        user = self.get_user(options['prefix'])
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        report = {
+            'commit': get_commit(),
+            'repeat': options['repeat'],
+            'data': {
+                model.__name__: model.objects.count()
+                for model in (User, Recipe, Follow, FavoriteRecipe,
+                              ShoppingCart, Ingredient, Tag)
+            },
+            'scenarios': {},
+        }
+        for name, method, path, params in self.get_scenarios(user):
+            result = self.run_scenario(
+                client, method, path, params,
+                options['repeat'], options['warmup'])
+            report['scenarios'][name] = result
+            self.stdout.write(
+                f'{name}: {result["throughput_rps"]} запр./с, '
+                f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+                f'p99 {result["p99_ms"]} мс, SQL {result["queries_max"]}')
+        with open(options['output'], 'w', encoding='utf8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+        self.stdout.write(f'Отчёт сохранён в {options["output"]}.')
@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.filters import IngredientFilter
+from recipes.management.benchmark import measure, percentile
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку поиска ингредиентов фильтром ORM '
+            '(icontains) и индексом в памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500,
+                            help='Количество поисковых запросов.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора запросов.')
+
+    @staticmethod
+    def make_queries(names, count, seed):
+        """Префиксы и подстроки случайных названий длиной 1-6 символов,
+        как при наборе текста в автодополнении."""
+        rng = random.Random(seed)
+        queries = []
+        for _ in range(count):
+            name = rng.choice(names)
+            length = rng.randint(1, 6)
+            start = 0
+            if rng.random() < 0.5:
+                start = rng.randint(0, max(len(name) - length, 0))
+            queries.append(name[start:start + length])
+        return queries
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Нет ингредиентов, загрузите их командой '
+                               'import_data_to_orm.')
+        queries = self.make_queries(
+            names, options['queries'], options['seed'])
+        started = time.perf_counter()
+        ingredient_index.invalidate()
+        ingredient_index.get_data()
+        build_time = (time.perf_counter() - started) * 1000
+        results = {
+            'orm': measure(
+                lambda query: list(IngredientFilter(
+                    {'name': query}, queryset=Ingredient.objects.all()
+                ).qs),
+                queries
+            ),
+            'index': measure(ingredient_index.search, queries),
+        }
+        self.stdout.write(
+            f'Ингредиентов: {len(names)}, запросов: {len(queries)}, '
+            f'построение индекса: {build_time:.1f} мс.')
+        for name, timings in results.items():
+            self.stdout.write(
+                f'{name:>6}: p50 {percentile(timings, 50):.3f} мс, '
+                f'p99 {percentile(timings, 99):.3f} мс'
+            )
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.renderers import ORJSONRenderer
+from api.views import RecipeViewSet
+from recipes.management.benchmark import measure, summarize
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время кодирования и размер страницы списка '
+            'рецептов для JSONRenderer и ORJSONRenderer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Количество повторов кодирования.')
+        parser.add_argument('--limit', type=int, default=50,
+                            help='Количество рецептов на странице.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс пользователей seed_benchmark_data, '
+                                 'от имени первого строится страница.')
+
+    def get_page(self, limit, prefix):
+        request = APIRequestFactory().get(
+            '/api/recipes/', {'page': 1, 'limit': limit})
+        user = User.objects.filter(
+            username__startswith=f'{prefix}_').order_by('pk').first()
+        if user is not None:
+            force_authenticate(request, user)
+        response = RecipeViewSet.as_view({'get': 'list'})(request)
+        if not response.data.get('results'):
+            raise CommandError(
+                'Нет рецептов для проверки, выполните seed_benchmark_data.')
+        return response.data
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        data = self.get_page(options['limit'], options['prefix'])
+        pages = [data] * options['repeat']
+        results = {}
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            name = type(renderer).__name__
+            content = renderer.render(data, 'application/json')
+            timings = measure(renderer.render, pages)
+            results[name] = content
+            stats = summarize(timings)
+            self.stdout.write(
+                f'{name}: {len(content)} байт, p50 {stats["p50_ms"]} мс, '
+                f'p95 {stats["p95_ms"]} мс, p99 {stats["p99_ms"]} мс')
+        if len(set(results.values())) == 1:
+            self.stdout.write('Ответы совпадают побайтно.')
+        else:
+            self.stdout.write(self.style.WARNING('Ответы различаются.'))
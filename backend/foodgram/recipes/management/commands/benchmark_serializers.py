@@ -0,0 +1,112 @@
+import time
+from collections import namedtuple
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import serializers
+from api.views import RecipeViewSet
+from recipes.management.benchmark import summarize
+from recipes.models import Recipe
+from user.models import User
+from user.views import UserViewSet
+
+
+Scenario = namedtuple('Scenario', (
+    'name', 'viewset', 'action', 'path', 'params', 'full_serializer',
+    'authenticated', 'kwargs'))
+
+
+def instrumented(viewset, action, serializer_class, timings):
+    """Представление, которое сериализует страницу заданным классом и
+    записывает время сериализации в мс. Без serializer_class
+    используется сериализатор представления."""
+
+    class View(viewset):
+        def get_serializer_class(self):
+            return serializer_class or super().get_serializer_class()
+
+        def get_serializer(self, *args, **kwargs):
+            serializer = super().get_serializer(*args, **kwargs)
+            started = time.perf_counter()
+            serializer.data
+            timings.append((time.perf_counter() - started) * 1000)
+            return serializer
+
+    return View.as_view({'get': action})
+
+
+class Command(BaseCommand):
+    help = ('Проверяет, что сериализаторы чтения рецептов, '
+            'пользователей и подписок отдают побайтно тот же ответ, что и '
+            'полные, и сравнивает время сериализации.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Количество запросов в каждом сценарии.')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Размер страницы.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс пользователей seed_benchmark_data.')
+
+    def get_user(self, prefix):
+        user = User.objects.filter(
+            username__startswith=f'{prefix}_', follower__isnull=False
+        ).order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет данных для проверки, выполните seed_benchmark_data.')
+        return user
+
+    def get_scenarios(self, limit):
+        params = {'page': 1, 'limit': limit}
+        recipe = Recipe.objects.order_by('-id').first()
+        yield Scenario('recipes.list', RecipeViewSet, 'list', '/api/recipes/',
+                       params, serializers.FullRecipeSerializer, False, {})
+        yield Scenario('recipes.list[user]', RecipeViewSet, 'list',
+                       '/api/recipes/', params,
+                       serializers.FullRecipeSerializer, True, {})
+        yield Scenario('recipes.detail', RecipeViewSet, 'retrieve',
+                       f'/api/recipes/{recipe.pk}/', {},
+                       serializers.FullRecipeSerializer, True,
+                       {'pk': recipe.pk})
+        yield Scenario('recipes.feed', RecipeViewSet, 'feed',
+                       '/api/recipes/feed/', {'limit': limit},
+                       serializers.FullRecipeSerializer, True, {})
+        yield Scenario('users.list', UserViewSet, 'list', '/api/users/',
+                       params, serializers.UserSerializer, True, {})
+        yield Scenario('users.subscriptions', UserViewSet, 'subscriptions',
+                       '/api/users/subscriptions/',
+                       {**params, 'recipes_limit': 3},
+                       serializers.SubscribeSerializer, True, {})
+
+    def get_content(self, view, scenario, user):
+        request = APIRequestFactory().get(scenario.path, scenario.params)
+        if scenario.authenticated:
+            force_authenticate(request, user)
+        response = view(request, **scenario.kwargs)
+        if response.status_code != 200:
+            raise CommandError(f'{scenario.path}: {response.status_code}')
+        return response.render().content
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        user = self.get_user(options['prefix'])
+        for scenario in self.get_scenarios(options['limit']):
+            line = [scenario.name]
+            contents = []
+            for label, serializer_class in (
+                    ('full', scenario.full_serializer), ('lean', None)):
+                timings = []
+                view = instrumented(scenario.viewset, scenario.action,
+                                    serializer_class, timings)
+                for _ in range(options['repeat']):
+                    contents.append(self.get_content(view, scenario, user))
+                stats = summarize(timings)
+                line.append(f'{label} p50 {stats["p50_ms"]} мс, '
+                            f'p95 {stats["p95_ms"]} мс')
+            if len(set(contents)) != 1:
+                raise CommandError(f'{scenario.name}: ответы различаются.')
+            line.append(f'ответы совпадают ({len(contents[0])} байт)')
+            self.stdout.write('; '.join(line))
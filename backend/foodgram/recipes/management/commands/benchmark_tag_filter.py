@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+
+from api.filters import RecipeFilter
+from recipes.management.benchmark import measure, percentile
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку первой страницы списка рецептов в '
+            'зависимости от количества выбранных тегов: фильтр EXISTS '
+            'против соединения с DISTINCT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Количество повторов для каждого шага.')
+        parser.add_argument('--page-size', type=int, default=6,
+                            help='Размер страницы.')
+
+    def handle(self, *args, **options):
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        if not slugs:
+            raise CommandError('Нет тегов для проверки.')
+        page_size = options['page_size']
+        filterset = RecipeFilter(
+            queryset=Recipe.objects.all(),
+            request=SimpleNamespace(user=AnonymousUser())
+        )
+
+        def exists_filter(selected):
+            queryset = filterset.filter_tags(
+                Recipe.objects.all(), 'tags', selected)
+            return list(queryset[:page_size]), queryset.count()
+
+        def distinct_join(selected):
+            queryset = Recipe.objects.filter(
+                tags__slug__in=selected).distinct()
+            return list(queryset[:page_size]), queryset.count()
+
+        for count in range(1, len(slugs) + 1):
+            selected = [slugs[:count]] * options['repeat']
+            line = [f'тегов: {count}']
+            for name, function in (('exists', exists_filter),
+                                   ('distinct', distinct_join)):
+                timings = measure(function, selected)
+                line.append(
+                    f'{name} p50 {percentile(timings, 50):.3f} мс, '
+                    f'p95 {percentile(timings, 95):.3f} мс'
+                )
+            self.stdout.write('; '.join(line))
@@ -0,0 +1,98 @@
+import json
+from itertools import combinations
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from api.filters import RecipeFilter
+from recipes.models import Recipe, ShoppingListItem, Tag
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN (ANALYZE, BUFFERS) для каждой комбинации '
+            'фильтров списка рецептов и выгрузки списка покупок и '
+            'завершается с ошибкой, если план использует '
+            'последовательное чтение большой таблицы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='Таблицы с меньшим числом строк не считаются большими.'
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Выводить планы запросов целиком.'
+        )
+
+    @staticmethod
+    def big_tables(min_rows):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relname FROM pg_class '
+                "WHERE relkind = 'r' AND reltuples >= %s",
+                (min_rows,)
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def seq_scans(self, plan):
+        if plan.get('Node Type') == 'Seq Scan':
+            yield plan['Relation Name']
+        for child in plan.get('Plans', ()):
+            yield from self.seq_scans(child)
+
+    def get_queries(self):
+        user = User.objects.annotate(
+            favorites=Count('favorite_recipes')
+        ).order_by('-favorites').first()
+        author = User.objects.annotate(
+            recipes_count=Count('recipes')
+        ).order_by('-recipes_count').first()
+        tag = Tag.objects.first()
+        if not (user and author and tag):
+            raise CommandError('Нет данных для проверки планов, '
+                               'выполните seed_benchmark_data.')
+        values = {
+            'author': author.pk,
+            'tags': tag.slug,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+        request = SimpleNamespace(user=user)
+        for size in range(len(values) + 1):
+            for names in combinations(values, size):
+                filterset = RecipeFilter(
+                    {name: values[name] for name in names},
+                    queryset=Recipe.objects.with_user_flags(user),
+                    request=request
+                )
+                yield ('recipes: ' + (', '.join(names) or 'без фильтров'),
+                       filterset.qs[:6])
+        yield ('download_shopping_cart',
+               ShoppingListItem.objects.filter(user=user).values(
+                   'ingredient__name', 'ingredient__measurement_unit',
+                   'amount').order_by('ingredient__name'))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов доступна только для '
+                               'PostgreSQL.')
+        big_tables = self.big_tables(options['min_rows'])
+        failures = []
+        for name, queryset in self.get_queries():
+            plan = json.loads(queryset.explain(
+                analyze=True, buffers=True, format='json'))[0]
+            scans = sorted(set(self.seq_scans(plan['Plan'])) & big_tables)
+            status = 'SEQ SCAN: ' + ', '.join(scans) if scans else 'OK'
+            self.stdout.write(
+                f'{name}: {plan["Execution Time"]:.2f} мс, {status}')
+            if options['verbose_plans']:
+                self.stdout.write(json.dumps(plan, indent=2))
+            if scans:
+                failures.append(name)
+        if failures:
+            raise CommandError(
+                'Последовательное чтение больших таблиц в запросах: '
+                + '; '.join(failures))
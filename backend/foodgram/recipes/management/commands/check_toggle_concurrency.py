@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from recipes.utils import live_shopping_lists, stored_shopping_lists
+from user.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = ('Отправляет из многих потоков одновременные запросы '
+            'добавления и удаления одной пары в избранное, корзину и '
+            'подписки. Проверяет, что пару изменяет ровно один запрос, '
+            'остальные получают ошибку, а список покупок и количество '
+            'подписчиков остаются согласованными. Запускается на '
+            'PostgreSQL с данными seed_benchmark_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Количество одновременных запросов.')
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Количество повторов каждого сценария.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс пользователей seed_benchmark_data.')
+
+    def get_scenarios(self, user):
+        recipe = Recipe.objects.exclude(author=user).order_by('pk').first()
+        if recipe is None:
+            raise CommandError(
+                'Нет данных для проверки, выполните seed_benchmark_data.')
+
+        def shopping_list_consistent():
+            return (live_shopping_lists([user.pk])
+                    == stored_shopping_lists([user.pk]))
+
+        def followers_count_consistent():
+            return User.objects.get(pk=recipe.author_id).followers_count == (
+                Follow.objects.filter(author=recipe.author_id).count())
+
+        yield ('favorite', f'/api/recipes/{recipe.pk}/favorite/', None)
+        yield ('shopping_cart', f'/api/recipes/{recipe.pk}/shopping_cart/',
+               shopping_list_consistent)
+        yield ('subscribe', f'/api/users/{recipe.author_id}/subscribe/',
+               followers_count_consistent)
+
+    def hammer(self, method, path, token, threads):
+        """Статусы ответов на threads одновременных запросов."""
+        barrier = threading.Barrier(threads)
+
+        def send(_):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            barrier.wait()
+            try:
+                return getattr(client, method)(path).status_code
+            except Exception:
+                return 500
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(threads) as executor:
+            return sorted(executor.map(send, range(threads)))
+
+    def check_round(self, path, token, threads):
+        for method, success in (('post', 201), ('delete', 204)):
+            statuses = self.hammer(method, path, token, threads)
+            expected = sorted([success] + [400] * (threads - 1))
+            if statuses != expected:
+                raise CommandError(
+                    f'{method.upper()} {path}: статусы {statuses}, '
+                    f'ожидались {expected}.')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        if threads < 2:
+            raise CommandError('--threads должен быть не меньше двух.')
+        user = User.objects.filter(
+            username__startswith=f'{options["prefix"]}_'
+        ).order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет данных для проверки, выполните seed_benchmark_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for name, path, consistent in self.get_scenarios(user):
+            # Проверка начинается без связи пользователя с объектом.
+            client.delete(path)
+            for _ in range(options['rounds']):
+                self.check_round(path, token.key, threads)
+                if consistent is not None and not consistent():
+                    raise CommandError(f'{name}: данные не согласованы.')
+            self.stdout.write(
+                f'{name}: {options["rounds"]} раундов по {threads} '
+                f'одновременных запросов, ошибок нет.')
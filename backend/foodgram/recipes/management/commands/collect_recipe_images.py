@@ -0,0 +1,83 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+IMAGE_FIELDS = ('image', 'image_thumbnail', 'image_preview')
+
+
+def get_references():
+    """Количество ссылок рецептов на каждый файл изображения."""
+    references = Counter()
+    for names in Recipe.objects.values_list(*IMAGE_FIELDS).iterator():
+        references.update(name for name in names if name)
+    return references
+
+
+def is_referenced(name):
+    """Ссылается ли на файл какой-либо рецепт сейчас: рецепт мог
+    получить файл после подсчёта ссылок."""
+    query = Q()
+    for field_name in IMAGE_FIELDS:
+        query |= Q(**{field_name: name})
+    return Recipe.objects.filter(query).exists()
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища, включая вложенные."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for file_name in files:
+        yield posixpath.join(directory, file_name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы изображений, на которые не ссылается ни один '
+            'рецепт: оставшиеся после удаления или смены изображения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help='Не удалять файлы моложе указанного числа секунд: их '
+                 'рецепты могут быть ещё не сохранены.'
+        )
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только вывести файлы для удаления.')
+
+    def handle(self, *args, **options):
+        references = get_references()
+        threshold = timezone.now() - timedelta(
+            seconds=options['min_age'])
+        count = 0
+        size = 0
+        for field_name in IMAGE_FIELDS:
+            field = Recipe._meta.get_field(field_name)
+            storage = field.storage
+            for name in walk(storage, field.upload_to.rstrip('/')):
+                if (references[name]
+                        or storage.get_modified_time(name) > threshold):
+                    continue
+                file_size = storage.size(name)
+                if not options['dry_run']:
+                    # Файл могли повторно загрузить во время обхода.
+                    if (is_referenced(name) or storage.get_modified_time(
+                            name) > threshold):
+                        continue
+                    storage.delete(name)
+                count += 1
+                size += file_size
+                self.stdout.write(name)
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {count}, {size / 1024 / 1024:.1f} МБ.')
@@ -1,12 +1,18 @@
-from csv import DictReader
-from os import path
+import csv
+import itertools
 import json
 import logging
+import re
+from os import path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import response_cache
+from api.renderers import Echo
 from foodgram.settings import BASE_DIR
 from recipes.models import Ingredient
+from recipes.search import ingredient_index
 
 
 logger = logging.getLogger('import_data_to_orm')
@@ -17,41 +23,213 @@ ING_DIR = BASE_DIR / 'data'
 if not path.exists(ING_DIR):
     ING_DIR = BASE_DIR.parent.parent / 'data'
 
+FIELDS = ('name', 'measurement_unit')
+CHUNK_SIZE = 1 << 16
+SEPARATORS = re.compile(r'[\s,]*')
+STAGING_TABLE = 'ingredient_import'
+
+
+def read_csv(file):
+    return csv.DictReader(file, fieldnames=FIELDS)
+
+
+def read_json(file):
+    """Потоково читает JSON массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Файл JSON должен содержать массив объектов.')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            row, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный файл JSON.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield row
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_jsonl,
+}
+
+
+class CSVStream:
+    """Файлоподобный объект для COPY: формирует CSV по мере чтения."""
+
+    def __init__(self, rows):
+        writer = csv.writer(Echo())
+        self.lines = (writer.writerow(row) for row in rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+        for line in self.lines:
+            parts.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(parts)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
 
 class Command(BaseCommand):
-    def json_reader(self):
-        reader = json.load(
-            open(ING_DIR / 'ingredients.json', encoding='utf8')
-        )
-        self.import_ing(reader)
+    help = ('Загружает ингредиенты из CSV, JSON или JSON Lines. Уже '
+            'существующие ингредиенты пропускаются.')
 
-    def csv_reader(self):
-        reader = DictReader(
-            open(ING_DIR / 'ingredients.csv', encoding='utf8'),
-            fieldnames=['name', 'measurement_unit']
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Путь к файлу, по умолчанию data/ingredients.<формат>.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--method',
+            choices=('auto', 'orm', 'copy'),
+            default='auto',
+            help='copy — COPY во временную таблицу и INSERT ON CONFLICT '
+                 '(только PostgreSQL), orm — пакетный bulk_create.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Размер пакета и шаг отчёта о прогрессе.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Вывести новые ингредиенты, ничего не записывая.'
         )
-        self.import_ing(reader)
-
-    def import_ing(self, reader):
-        err_count = 0
-        len_obj = 0
-        logging.info('Добавление ингредиентов.')
-        for row in reader:
-            obj, created = Ingredient.objects.get_or_create(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
+
+    def get_source(self, options):
+        file_format = options['format']
+        file_path = options['path']
+        if file_path is None:
+            file_path = ING_DIR / f'ingredients.{file_format or "csv"}'
+        if file_format is None:
+            file_format = path.splitext(str(file_path))[1].lstrip('.')
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла {file_path}, укажите --format.')
+        return file_path, READERS[file_format]
+
+    def clean_rows(self, rows):
+        """Проверяет строки и сообщает о прогрессе."""
+        max_length = Ingredient._meta.get_field('name').max_length
+        for number, row in enumerate(rows, 1):
+            if number % self.batch_size == 0:
+                logger.info(f'Обработано строк: {number}.')
+            self.total = number
+            if not isinstance(row, dict):
+                row = {}
+            values = tuple(str(row.get(field) or '').strip()
+                           for field in FIELDS)
+            if all(values) and max(map(len, values)) <= max_length:
+                yield values
+                continue
+            self.invalid += 1
+            logger.warning(f'Строка {number} пропущена: {row}.')
+
+    def batches(self, rows):
+        rows = iter(rows)
+        batch = list(itertools.islice(rows, self.batch_size))
+        while batch:
+            yield batch
+            batch = list(itertools.islice(rows, self.batch_size))
+
+    def diff(self, rows):
+        """Выводит ингредиенты, которых нет в базе, и их количество."""
+        seen = set()
+        created = 0
+        for batch in self.batches(rows):
+            seen.update(Ingredient.objects.filter(
+                name__in={name for name, unit in batch}
+            ).values_list(*FIELDS))
+            for values in batch:
+                if values not in seen:
+                    seen.add(values)
+                    created += 1
+                    self.stdout.write('+ {}, {}'.format(*values))
+        return created
+
+    def import_orm(self, rows):
+        before = Ingredient.objects.count()
+        for batch in self.batches(rows):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch),
+                ignore_conflicts=True
+            )
+        return Ingredient.objects.count() - before
+
+    @transaction.atomic
+    def import_copy(self, rows):
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(map(quote_name, FIELDS))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+                f'(name text, measurement_unit text) ON COMMIT DROP'
             )
-            len_obj += 1
-            if not created:
-                err_count += 1
-        logging.info('Количество добавленых ингредиентов: '
-                     f'{len_obj - err_count} из {len_obj}.')
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} ({columns}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                CSVStream(rows)
+            )
+            # Конфликты разрешаются ограничением unique_name_unit.
+            cursor.execute(
+                f'INSERT INTO {quote_name(Ingredient._meta.db_table)} '
+                f'({columns}) SELECT {columns} FROM {STAGING_TABLE} '
+                f'ON CONFLICT DO NOTHING'
+            )
+            return cursor.rowcount
+
+    def get_importer(self, options):
+        if options['dry_run']:
+            return self.diff
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'orm'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('Метод copy доступен только для PostgreSQL.')
+        return self.import_copy if method == 'copy' else self.import_orm
 
     def handle(self, *args, **options):
-        reader_set = {
-            'json': self.json_reader,
-            'csv': self.csv_reader
-        }
-        format = input('Введите формат импортируемого файла: ')
-        if format in reader_set:
-            reader_set[format]()
+        file_path, reader = self.get_source(options)
+        importer = self.get_importer(options)
+        self.batch_size = options['batch_size']
+        self.total = 0
+        self.invalid = 0
+        logger.info(f'Добавление ингредиентов из {file_path}.')
+        try:
+            with open(file_path, encoding='utf-8-sig', newline='') as file:
+                created = importer(self.clean_rows(reader(file)))
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {file_path}: {error}')
+        verb = 'Будет добавлено' if options['dry_run'] else 'Добавлено'
+        logger.info(f'{verb} ингредиентов: {created} из {self.total}, '
+                    f'некорректных строк: {self.invalid}.')
+        if created and not options['dry_run']:
+            # Массовая вставка не отправляет сигналы, сбрасывающие кэш.
+            response_cache.bump(Ingredient)
+            ingredient_index.invalidate()
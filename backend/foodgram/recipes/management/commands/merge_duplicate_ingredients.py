@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from recipes.models import IngredientRecipeAmount, Recipe
+
+
+class Command(BaseCommand):
+    help = ('Объединяет повторяющиеся ингредиенты рецептов в одну запись '
+            'с суммарным количеством. Выполняется перед migrate, '
+            'добавляющей ограничение unique_recipe_ingredient.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        table = IngredientRecipeAmount._meta.db_table
+        if table not in connection.introspection.table_names():
+            self.stdout.write('Таблицы ингредиентов рецептов ещё нет.')
+            return
+        duplicates = list(
+            IngredientRecipeAmount.objects.values(
+                'recipe_id', 'ingredient_id'
+            ).annotate(
+                count=Count('id'), keep=Min('id'), total=Sum('amount')
+            ).filter(count__gt=1).order_by()
+        )
+        if not duplicates:
+            self.stdout.write('Повторяющихся ингредиентов нет.')
+            return
+        IngredientRecipeAmount.objects.bulk_update(
+            [IngredientRecipeAmount(pk=row['keep'], amount=row['total'])
+             for row in duplicates],
+            ('amount',), batch_size=1000
+        )
+        pairs = Q()
+        for row in duplicates:
+            pairs |= Q(recipe_id=row['recipe_id'],
+                       ingredient_id=row['ingredient_id'])
+        deleted, _ = IngredientRecipeAmount.objects.filter(pairs).exclude(
+            pk__in=[row['keep'] for row in duplicates]).delete()
+        # Суммы в списках покупок не меняются, меняется вывод рецептов.
+        Recipe.objects.filter(
+            pk__in={row['recipe_id'] for row in duplicates}
+        ).update(updated=timezone.now())
+        self.stdout.write(
+            f'Объединено пар рецепт-ингредиент: {len(duplicates)}, '
+            f'удалено записей: {deleted}.')
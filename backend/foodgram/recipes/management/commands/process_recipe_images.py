@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.images import VARIANTS, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт копии изображений рецептов, для которых они ещё не '
+            'созданы, например после массовой загрузки или перезапуска '
+            'с необработанной очередью.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать изображения всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            missing = Q()
+            for variant in VARIANTS:
+                missing |= Q(**{f'image_{variant}': ''})
+            recipes = recipes.filter(missing)
+        count = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            try:
+                process_recipe_image(recipe_id)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            count += 1
+        self.stdout.write(f'Обработано изображений: {count}.')
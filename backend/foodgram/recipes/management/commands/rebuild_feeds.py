@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает количество подписчиков авторов и пересобирает '
+            'ленты подписок, например после массовой загрузки данных.')
+
+    def handle(self, *args, **options):
+        count = rebuild_feeds()
+        self.stdout.write(f'Записей в лентах: {count}.')
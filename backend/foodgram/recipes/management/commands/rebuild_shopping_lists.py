@@ -0,0 +1,54 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.utils import (live_shopping_lists, rebuild_shopping_lists,
+                           stored_shopping_lists)
+
+
+logger = logging.getLogger('rebuild_shopping_lists')
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает денормализованные списки покупок и сверяет их '
+            'с расчётом по корзинам пользователей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Только сверить списки, не пересобирая их.'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='id пользователя, можно указать несколько раз.'
+        )
+
+    def verify(self, user_ids):
+        live = live_shopping_lists(user_ids)
+        stored = stored_shopping_lists(user_ids)
+        mismatches = {
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatches):
+            logger.warning(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидается {live.get((user_id, ingredient_id))}, '
+                f'сохранено {stored.get((user_id, ingredient_id))}.'
+            )
+        return len(mismatches)
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if not options['verify_only']:
+            count = rebuild_shopping_lists(user_ids)
+            logger.info(f'Пересобрано позиций списков покупок: {count}.')
+        mismatches = self.verify(user_ids)
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {mismatches}.')
+        logger.info('Списки покупок совпадают с корзинами.')
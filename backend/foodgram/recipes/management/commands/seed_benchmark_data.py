@@ -0,0 +1,231 @@
+import io
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import response_cache
+from recipes.models import (FavoriteRecipe, Ingredient,
+                            IngredientRecipeAmount, Recipe, ShoppingCart, Tag)
+from recipes.feed import rebuild_feeds
+from recipes.search import ingredient_index, update_search_vectors
+from recipes.utils import rebuild_shopping_lists
+from user.models import Follow, User
+
+
+IMAGE_NAME = 'recipes/images/benchmark.png'
+
+DISHES = ('суп', 'салат', 'пирог', 'омлет', 'рагу', 'плов', 'каша',
+          'запеканка', 'котлеты', 'блины', 'паста', 'борщ')
+ADJECTIVES = ('домашний', 'быстрый', 'овощной', 'сырный', 'пряный',
+              'летний', 'грибной', 'сливочный', 'острый', 'праздничный')
+WORDS = ('нарезать', 'обжарить', 'смешать', 'добавить', 'посолить',
+         'запечь', 'отварить', 'подавать', 'горячим', 'минут')
+
+
+def zipf_weights(count, exponent=1.1):
+    """Накопленные веса закона Ципфа: немногие объекты популярны,
+    большинство — нет."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def geometric(rng, mean):
+    """Случайное количество с геометрическим распределением."""
+    if mean <= 0:
+        return 0
+    count = 0
+    while rng.random() > 1 / (mean + 1):
+        count += 1
+    return count
+
+
+def weighted_sample(rng, population, cum_weights, count):
+    """До count различных объектов с учётом весов."""
+    count = min(count, len(population))
+    chosen = set(rng.choices(population, cum_weights=cum_weights,
+                             k=count * 2))
+    return list(chosen)[:count]
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетических пользователей, рецепты, подписки, '
+            'избранное и корзины для нагрузочных тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Количество пользователей.')
+        parser.add_argument('--recipes', type=int, default=5000,
+                            help='Количество рецептов.')
+        parser.add_argument('--follows', type=float, default=10,
+                            help='Среднее количество подписок.')
+        parser.add_argument('--favorites', type=float, default=15,
+                            help='Среднее количество избранных рецептов.')
+        parser.add_argument('--carts', type=float, default=3,
+                            help='Среднее количество рецептов в корзине.')
+        parser.add_argument('--tags', type=int, default=6,
+                            help='Минимальное количество тегов.')
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Количество ингредиентов, если их нет.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора случайных чисел.')
+        parser.add_argument('--prefix', default='bench',
+                            help='Префикс имён пользователей.')
+        parser.add_argument('--password', default='benchmark-password',
+                            help='Пароль пользователей.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Размер пакета bulk_create.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные данные.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}_')
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(
+                    f'Пользователи с префиксом {prefix} уже есть, '
+                    f'используйте --clear.')
+            existing.delete()
+        with transaction.atomic():
+            tags = self.seed_tags(options['tags'])
+            ingredients = self.seed_ingredients(options['ingredients'])
+            users = self.seed_users(
+                options['users'], prefix, options['password'])
+            recipes = self.seed_recipes(
+                options['recipes'], prefix, users, tags, ingredients)
+            self.seed_relations(users, recipes, options)
+            update_search_vectors(Recipe.objects.filter(
+                author__username__startswith=f'{prefix}_'))
+            rebuild_shopping_lists(users)
+            rebuild_feeds()
+        # Массовые вставки не отправляют сигналы, сбрасывающие кэши.
+        response_cache.bump(Tag)
+        response_cache.bump(Ingredient)
+        ingredient_index.invalidate()
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}.')
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def seed_tags(self, count):
+        missing = count - Tag.objects.count()
+        if missing > 0:
+            used = set(Tag.objects.values_list('color', flat=True))
+            colors = (f'#{value:06x}' for value in range(0x1000000)
+                      if f'#{value:06x}' not in used)
+            self.bulk_create(Tag, [
+                Tag(name=f'Тег {index}', slug=f'bench-tag-{index}',
+                    color=next(colors))
+                for index in range(missing)
+            ])
+        return list(Tag.objects.values_list('pk', flat=True).order_by('pk'))
+
+    def seed_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            self.bulk_create(Ingredient, [
+                Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+                for index in range(count)
+            ])
+        return list(
+            Ingredient.objects.values_list('pk', flat=True).order_by('pk'))
+
+    def seed_users(self, count, prefix, password):
+        password = make_password(password)
+        self.bulk_create(User, [
+            User(username=f'{prefix}_{index}',
+                 email=f'{prefix}_{index}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for index in range(count)
+        ])
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('pk', flat=True).order_by('pk'))
+
+    def get_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+        # Одинаковое содержимое хранится в одном файле.
+        return Recipe._meta.get_field('image').storage.save(
+            IMAGE_NAME, ContentFile(buffer.getvalue()))
+
+    def seed_recipes(self, count, prefix, users, tags, ingredients):
+        rng = self.rng
+        # Рецепты публикует треть пользователей, самые активные — чаще.
+        authors = rng.sample(users, max(1, len(users) // 3))
+        author_weights = zipf_weights(len(authors))
+        image = self.get_image()
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=author_id,
+                name=(f'{rng.choice(DISHES)} {rng.choice(ADJECTIVES)} '
+                      f'№{index}'),
+                text=' '.join(rng.choices(WORDS, k=20)),
+                cooking_time=rng.randint(5, 180),
+                image=image
+            )
+            for index, author_id in enumerate(rng.choices(
+                authors, cum_weights=author_weights, k=count))
+        ])
+        recipes = list(Recipe.objects.filter(
+            author__username__startswith=f'{prefix}_'
+        ).values_list('pk', flat=True).order_by('pk'))
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in rng.sample(tags, min(len(tags), rng.randint(1, 3)))
+        ])
+        self.bulk_create(IngredientRecipeAmount, [
+            IngredientRecipeAmount(recipe_id=recipe_id,
+                                   ingredient_id=ingredient_id,
+                                   amount=rng.randint(1, 500))
+            for recipe_id in recipes
+            for ingredient_id in rng.sample(
+                ingredients, min(len(ingredients), rng.randint(3, 12)))
+        ])
+        return recipes
+
+    def seed_relations(self, users, recipes, options):
+        rng = self.rng
+        authors = list(User.objects.filter(
+            username__startswith=f'{options["prefix"]}_',
+            recipes__isnull=False
+        ).values_list('pk', flat=True).order_by('pk').distinct())
+        # Популярность авторов и рецептов также распределена по Ципфу.
+        rng.shuffle(authors)
+        rng.shuffle(recipes)
+        author_weights = zipf_weights(len(authors))
+        recipe_weights = zipf_weights(len(recipes))
+        follows, favorites, carts = [], [], []
+        for user_id in users:
+            follows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in weighted_sample(
+                    rng, authors, author_weights,
+                    geometric(rng, options['follows']))
+                if author_id != user_id
+            )
+            favorites.extend(
+                FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in weighted_sample(
+                    rng, recipes, recipe_weights,
+                    geometric(rng, options['favorites']))
+            )
+            carts.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in weighted_sample(
+                    rng, recipes, recipe_weights,
+                    geometric(rng, options['carts']))
+            )
+        self.bulk_create(Follow, follows)
+        self.bulk_create(FavoriteRecipe, favorites)
+        self.bulk_create(ShoppingCart, carts)
@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
-from user.models import User
+from recipes.storage import content_storage
+from user.models import Follow, User
 
 
 class Tag(models.Model):
@@ -67,6 +70,103 @@ class Ingredient(models.Model):
         return self.name
 
 
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+# Столбцы рецепта, нужные для полей ответа.
+RECIPE_COLUMNS = {
+    'author': ('author',),
+    'name': ('name',),
+    'image': ('image', 'image_thumbnail', 'image_preview'),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+}
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов с предвычисленными данными для сериализаторов."""
+
+    def with_user_flags(self, user, flags=USER_FLAGS):
+        """Аннотирует флаги избранного и корзины для пользователя."""
+        if user.is_anonymous:
+            return self.annotate(**{
+                flag: models.Value(False, output_field=models.BooleanField())
+                for flag in flags
+            })
+        relations = {
+            'is_favorited': FavoriteRecipe,
+            'is_in_shopping_cart': ShoppingCart,
+        }
+        return self.annotate(**{
+            flag: models.Exists(relations[flag].objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+            for flag in flags
+        })
+
+    def limit_per_author(self, limit):
+        """Оставляет не более limit последних рецептов каждого автора
+        одним запросом с коррелированным подзапросом."""
+        return self.filter(pk__in=models.Subquery(
+            self.model.objects.filter(
+                author=models.OuterRef('author')
+            ).values('pk')[:limit]
+        ))
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Рецепты большинства авторов берутся из ленты пользователя, а
+        рецепты авторов, у которых подписчиков больше
+        FEED_FANOUT_LIMIT, в ленту не раскладываются и читаются
+        напрямую."""
+        large_authors = Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values('author')
+        if not large_authors.exists():
+            return self.filter(feed_items__user=user)
+        return self.filter(
+            models.Exists(FeedItem.objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+            | models.Q(author__in=large_authors)
+        )
+
+    def with_related(self, user, fields=None, expand=None):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов независимо от количества рецептов.
+
+        fields — поля ответа, expand — связи, раскрываемые в объекты,
+        None — все. Столбцы, аннотации и подгрузки для полей, которых
+        нет в ответе, пропускаются."""
+        def requested(name):
+            return fields is None or name in fields
+
+        def expanded(name):
+            return requested(name) and (expand is None or name in expand)
+
+        queryset = self.with_user_flags(
+            user, [flag for flag in USER_FLAGS if requested(flag)])
+        if fields is not None:
+            queryset = queryset.only('id', *(
+                column for name, columns in RECIPE_COLUMNS.items()
+                if name in fields for column in columns
+            ))
+        prefetches = []
+        if expanded('author'):
+            prefetches.append(models.Prefetch(
+                'author', queryset=User.objects.with_subscription(user)))
+        if requested('tags'):
+            prefetches.append(models.Prefetch(
+                'tags', queryset=Tag.objects.all() if expanded('tags')
+                else Tag.objects.only('id')))
+        if requested('ingredients'):
+            amounts = IngredientRecipeAmount.objects.all()
+            if expanded('ingredients'):
+                amounts = amounts.select_related('ingredient')
+            prefetches.append(models.Prefetch(
+                'ingredientrecipeamount_set', queryset=amounts))
+        return queryset.prefetch_related(*prefetches)
+
+
 class Recipe(models.Model):
     """Модель, описывающая рецепты пользователей."""
     name = models.CharField(
@@ -76,8 +176,21 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=content_storage,
         verbose_name='Ссылка на картинку'
     )
+    image_thumbnail = models.ImageField(
+        upload_to='recipes/thumbnails/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра для списков'
+    )
+    image_preview = models.ImageField(
+        upload_to='recipes/previews/',
+        blank=True,
+        editable=False,
+        verbose_name='Изображение для страницы рецепта'
+    )
     text = models.TextField(
         max_length=300,
         verbose_name='Описание'
@@ -106,11 +219,32 @@ class Recipe(models.Model):
         through='IngredientRecipeAmount',
         related_name='recipes'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = '-id',
+        indexes = [
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -133,6 +267,9 @@ class FavoriteRecipe(models.Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        # Индекс ограничения (user, recipe) обслуживает и фильтры по
+        # пользователю, и выборку с сортировкой -recipe_id: PostgreSQL
+        # читает его в обратном порядке, отдельный индекс не нужен.
         constraints = [
             models.UniqueConstraint(
                 fields=('user', 'recipe'),
@@ -161,6 +298,12 @@ class IngredientRecipeAmount(models.Model):
     class Meta:
         verbose_name = 'Ингредиент и его количество'
         verbose_name_plural = 'Ингредиенты и их количество'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            )
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -180,9 +323,86 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+        # Индекс ограничения (user, recipe) обслуживает и фильтры по
+        # пользователю, и выборку с сортировкой -recipe_id: PostgreSQL
+        # читает его в обратном порядке, отдельный индекс не нужен.
         constraints = [
             models.UniqueConstraint(
                 fields=('user', 'recipe'),
                 name='unique_recipe_in_cart'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """Денормализованный итог списка покупок пользователя.
+
+    Поддерживается инкрементально при изменении корзины и ингредиентов
+    рецептов, пересобирается командой rebuild_shopping_lists."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Заполняется при публикации рецепта и подписке, очищается при
+    отписке, пересобирается командой rebuild_feeds."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            )
+        ]
+        # Индекс ограничения unique_feed_item обслуживает чтение ленты
+        # с сортировкой по убыванию рецепта.
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx'
+            )
+        ]
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Ingredient, IngredientRecipeAmount, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+class IngredientSearchIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Строится лениво при первом поиске: отсортированный список названий
+    отвечает на поиск по префиксу, словарь n-грамм сужает кандидатов
+    для поиска по подстроке. Сбрасывается сигналами при изменении
+    ингредиентов и по истечении TTL, чтобы догнать изменения,
+    сделанные в других процессах."""
+    ngram = 3
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = None
+        self.built_at = 0
+
+    def invalidate(self):
+        self.data = None
+
+    def ngrams(self, value):
+        return {
+            value[i:i + self.ngram]
+            for i in range(len(value) - self.ngram + 1)
+        }
+
+    def build(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (
+                ingredient.name.lower(), ingredient.measurement_unit)
+        )
+        names = [ingredient.name.lower() for ingredient in ingredients]
+        grams = defaultdict(set)
+        for position, name in enumerate(names):
+            for gram in self.ngrams(name):
+                grams[gram].add(position)
+        return ingredients, names, dict(grams)
+
+    def get_data(self):
+        ttl = settings.INGREDIENT_SEARCH_INDEX_TTL if (
+            self.ttl is None) else self.ttl
+        data = self.data
+        if data is not None and time.monotonic() - self.built_at < ttl:
+            return data
+        with self.lock:
+            if self.data is data:
+                self.data = self.build()
+                self.built_at = time.monotonic()
+            return self.data
+
+    def substring_candidates(self, query, names, grams):
+        if len(query) < self.ngram:
+            return range(len(names))
+        positions = [grams.get(gram, set()) for gram in self.ngrams(query)]
+        return sorted(set.intersection(*positions))
+
+    def search(self, query):
+        """Ингредиенты, название которых начинается с query, затем
+        содержащие query, каждая группа в алфавитном порядке."""
+        ingredients, names, grams = self.get_data()
+        query = query.lower()
+        start = bisect_left(names, query)
+        end = bisect_left(names, query + '\uffff', lo=start)
+        substring = [
+            position
+            for position in self.substring_candidates(query, names, grams)
+            if not start <= position < end and query in names[position]
+        ]
+        return ingredients[start:end] + [
+            ingredients[position] for position in substring
+        ]
+
+
+ingredient_index = IngredientSearchIndex()
+
+
+def is_postgresql(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    """Поисковый вектор рецепта: название, описание и названия
+    ингредиентов с убывающим весом."""
+    ingredient_names = Subquery(
+        IngredientRecipeAmount.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(ingredient_names, Value('')),
+                       weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset, using=DEFAULT_DB_ALIAS):
+    """Пересчитывает поисковые векторы рецептов, только в PostgreSQL."""
+    if is_postgresql(using):
+        queryset.using(using).update(search_vector=recipe_search_vector())
+
+
+def search_recipes(queryset, text):
+    """Рецепты, найденные по названию, описанию и ингредиентам,
+    упорядоченные по релевантности.
+
+    В PostgreSQL используются полнотекстовый поиск и триграммы, в
+    остальных СУБД (например, SQLite в тестах) - поиск подстроки."""
+    if not is_postgresql(queryset.db):
+        ingredients = IngredientRecipeAmount.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=text)
+        return queryset.filter(
+            Exists(ingredients)
+            | Q(name__icontains=text)
+            | Q(text__icontains=text)
+        )
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(
+        Q(search_vector=query) | Q(name__trigram_similar=text)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), query)
+        + TrigramSimilarity('name', text)
+    ).order_by('-rank', '-id')
+
+
+def create_search_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Создаёт расширение pg_trgm и GIN индексы поиска.
+
+    Миграции генерируются при развёртывании, поэтому объекты,
+    специфичные для PostgreSQL, создаются идемпотентно после migrate.
+    Индекс по UPPER(name) ингредиентов обслуживает icontains."""
+    if not is_postgresql(using):
+        return
+    ingredient_table = Ingredient._meta.db_table
+    recipe_table = Recipe._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {ingredient_table}_name_trgm '
+            f'ON {ingredient_table} USING gin (UPPER(name) gin_trgm_ops)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {recipe_table}_name_trgm '
+            f'ON {recipe_table} USING gin (name gin_trgm_ops)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {recipe_table}_search_vector '
+            f'ON {recipe_table} USING gin (search_vector)'
+        )
+    update_search_vectors(
+        Recipe.objects.filter(search_vector__isnull=True), using)
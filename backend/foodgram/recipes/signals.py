@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.feed import fan_out_recipe, follow_author, unfollow_author
+from recipes.images import VARIANTS, schedule_image_processing
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import ingredient_index, update_search_vectors
+from recipes.utils import recipe_amounts, update_shopping_lists
+from user.models import Follow, User
+
+# Поля пользователя, которые выводятся в рецептах как данные автора.
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в список покупок."""
+    if created:
+        update_shopping_lists(
+            (instance.user_id,), recipe_amounts(instance.recipe_id))
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    """Вычитает ингредиенты рецепта из списка покупок.
+
+    Используется pre_delete: при каскадном удалении рецепта его
+    ингредиенты к post_delete уже могут быть удалены."""
+    update_shopping_lists(
+        (instance.user_id,), recipe_amounts(instance.recipe_id, sign=-1))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс поиска ингредиентов после фиксации изменений."""
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes(sender, instance, created, **kwargs):
+    """Обновляет поисковые векторы и дату изменения рецептов при
+    изменении ингредиента."""
+    if not created:
+        recipes = Recipe.objects.filter(ingredients=instance)
+        recipes.update(updated=timezone.now())
+        update_search_vectors(recipes)
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_recipes(sender, instance, created, **kwargs):
+    """Обновляет дату изменения рецептов при изменении тега."""
+    if not created:
+        instance.recipes.update(updated=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields,
+                         **kwargs):
+    """Обновляет дату изменения рецептов автора при изменении его данных,
+    чтобы ETag и Last-Modified рецептов учитывали автора."""
+    if created or (update_fields is not None
+                   and AUTHOR_FIELDS.isdisjoint(update_fields)):
+        return
+    instance.recipes.update(updated=timezone.now())
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_image_variants(sender, instance, **kwargs):
+    """Сбрасывает копии изображения, если загружено новое: до их
+    создания отдаётся оригинал."""
+    instance.image_changed = bool(
+        instance.image and not instance.image._committed)
+    if instance.image_changed:
+        for variant in VARIANTS:
+            setattr(instance, f'image_{variant}', '')
+
+
+@receiver(post_save, sender=Recipe)
+def process_image_variants(sender, instance, **kwargs):
+    """Создаёт копии нового изображения в фоне."""
+    if getattr(instance, 'image_changed', False):
+        schedule_image_processing(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(sender, instance, created, **kwargs):
+    """Раскладывает новый рецепт по лентам подписчиков."""
+    if created:
+        fan_out_recipe(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    """Добавляет рецепты автора в ленту нового подписчика."""
+    if created:
+        follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    """Убирает рецепты автора из ленты отписавшегося."""
+    unfollow_author(instance.user_id, instance.author_id)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 содержимого.
+
+    Файлы раскладываются по каталогам из первых символов хэша, а
+    одинаковые файлы записываются один раз. Содержимое файла под
+    конкретным именем никогда не меняется, поэтому такие файлы можно
+    отдавать с бессрочным кэшированием. Неиспользуемые файлы удаляет
+    команда collect_recipe_images."""
+
+    @staticmethod
+    def get_digest(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_content_name(self, name, content):
+        directory, file_name = posixpath.split(name)
+        digest = self.get_digest(content)
+        extension = posixpath.splitext(file_name)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        # Повторно используемый файл получает новую дату изменения, чтобы
+        # collect_recipe_images не удалил его как давно забытый. Если
+        # файл удалили между проверками, он записывается заново.
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self._save(name, content)
+        return name
+
+    def _save(self, name, content):
+        """Записывает файл во временный и атомарно переименовывает его:
+        при одновременной записи одинакового содержимого побеждает
+        любой из них."""
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode,
+                            exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            mode = self.file_permissions_mode
+            if mode is None:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temporary_path, mode)
+            os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
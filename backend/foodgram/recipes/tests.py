@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from recipes.management.commands import collect_recipe_images
+from recipes.models import FeedItem, Recipe
+from recipes.storage import content_storage
+from user.models import Follow, User
+
+
+class CollectRecipeImagesTest(TestCase):
+    """Сборка неиспользуемых изображений не удаляет файлы, которые снова
+    используются."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия', password='Pass12345!'
+        )
+
+    def save_orphan(self, content=b'image'):
+        """Файл без ссылок рецептов, изменённый два часа назад."""
+        name = content_storage.save(
+            'recipes/images/image.png', ContentFile(content))
+        past = time.time() - 2 * 60 * 60
+        os.utime(content_storage.path(name), (past, past))
+        return name
+
+    def collect(self):
+        call_command('collect_recipe_images', stdout=StringIO())
+
+    def test_orphan_deleted(self):
+        name = self.save_orphan()
+        self.collect()
+        self.assertFalse(content_storage.exists(name))
+
+    def test_dedupe_refreshes_orphan(self):
+        name = self.save_orphan()
+        self.assertEqual(content_storage.save(
+            'recipes/images/other.png', ContentFile(b'image')), name)
+        self.collect()
+        self.assertTrue(content_storage.exists(name))
+
+    def test_dedupe_after_delete_rewrites_file(self):
+        name = self.save_orphan()
+        content_storage.delete(name)
+        content_storage.save('recipes/images/image.png',
+                             ContentFile(b'image'))
+        self.assertTrue(content_storage.exists(name))
+
+    def test_referenced_during_walk_kept(self):
+        name = self.save_orphan()
+        Recipe.objects.create(
+            name='Рецепт', image=name, text='Описание', cooking_time=10,
+            author=self.author
+        )
+        # Ссылки посчитаны до того, как рецепт получил файл.
+        with mock.patch.object(collect_recipe_images, 'get_references',
+                               return_value=Counter()):
+            self.collect()
+        self.assertTrue(content_storage.exists(name))
+
+
+@override_settings(FEED_FANOUT_LIMIT=2, FEED_BACKFILL_WORKERS=0)
+class FeedTest(TestCase):
+    """Ленты подписок: раскладка рецептов при публикации и подписке,
+    удаление при отписке и переход через FEED_FANOUT_LIMIT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, *cls.followers = (
+            User.objects.create_user(
+                email=f'user{i}@foodgram.ru', username=f'user{i}',
+                first_name='Имя', last_name='Фамилия', password='Pass12345!'
+            ) for i in range(4)
+        )
+
+    def create_recipe(self, number):
+        return Recipe.objects.create(
+            name=f'Рецепт {number}', image='recipes/images/recipe.png',
+            text='Описание', cooking_time=10, author=self.author
+        )
+
+    def follow(self, user):
+        Follow.objects.create(user=user, author=self.author)
+
+    def feed_ids(self, user):
+        return set(FeedItem.objects.filter(user=user).values_list(
+            'recipe_id', flat=True))
+
+    def visible_ids(self, user):
+        return set(Recipe.objects.feed(user).values_list('id', flat=True))
+
+    def test_fan_out_on_create(self):
+        self.follow(self.followers[0])
+        recipe = self.create_recipe(1)
+        self.assertEqual(self.feed_ids(self.followers[0]), {recipe.pk})
+
+    def test_backfill_on_follow(self):
+        recipes = {self.create_recipe(i).pk for i in range(3)}
+        self.follow(self.followers[0])
+        self.assertEqual(self.feed_ids(self.followers[0]), recipes)
+
+    def test_trim_on_unfollow(self):
+        self.follow(self.followers[0])
+        self.create_recipe(1)
+        Follow.objects.filter(user=self.followers[0]).delete()
+        self.assertEqual(self.feed_ids(self.followers[0]), set())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_fan_out_limit_crossing(self):
+        for user in self.followers:
+            self.follow(user)
+        # Подписчиков больше порога: рецепт читается из таблицы рецептов.
+        recipe = self.create_recipe(1)
+        self.assertEqual(self.feed_ids(self.followers[0]), set())
+        self.assertEqual(self.visible_ids(self.followers[0]), {recipe.pk})
+        # Автор вернулся под порог: ленты заполняются после фиксации.
+        with self.captureOnCommitCallbacks() as callbacks:
+            Follow.objects.filter(user=self.followers[2]).delete()
+        self.assertEqual(self.feed_ids(self.followers[0]), set())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        for user in self.followers[:2]:
+            self.assertEqual(self.feed_ids(user), {recipe.pk})
+            self.assertEqual(self.visible_ids(user), {recipe.pk})
+        self.assertEqual(self.feed_ids(self.followers[2]), set())
@@ -0,0 +1,161 @@
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (IngredientRecipeAmount, ShoppingCart,
+                            ShoppingListItem)
+
+# Количество позиций списка покупок в одном INSERT.
+SHOPPING_LIST_BATCH_SIZE = 500
+
+
+def recipe_amounts(recipe_id, sign=1):
+    """Количество каждого ингредиента рецепта со знаком sign."""
+    return {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in IngredientRecipeAmount.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+    }
+
+
+def recipes_amounts(recipe_ids, sign=1):
+    """Суммарное количество каждого ингредиента рецептов со знаком
+    sign."""
+    return {
+        ingredient_id: sign * total
+        for ingredient_id, total in IngredientRecipeAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')).values_list('ingredient_id', 'total')
+    }
+
+
+def add_recipes_to_shopping_list(user_id, recipe_ids):
+    """Добавляет ингредиенты рецептов в список покупок. Для массовой
+    вставки в корзину, которая не отправляет сигналы."""
+    update_shopping_lists((user_id,), recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_shopping_list(user_id, recipe_ids):
+    """Вычитает ингредиенты рецептов из списка покупок. Для массового
+    удаления из корзины, которое не отправляет сигналы."""
+    update_shopping_lists((user_id,), recipes_amounts(recipe_ids, sign=-1))
+
+
+def upsert_shopping_list_items(rows):
+    """Прибавляет количество к позициям списков покупок rows
+    ([(user_id, ingredient_id, amount)]) одним INSERT ... ON CONFLICT DO
+    UPDATE: отсутствующие позиции создаются, и одновременные добавления
+    одного ингредиента не приводят к IntegrityError."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(ShoppingListItem._meta.db_table)
+    user_column, ingredient_column, amount_column = (
+        quote_name(ShoppingListItem._meta.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount')
+    )
+    for start in range(0, len(rows), SHOPPING_LIST_BATCH_SIZE):
+        batch = rows[start:start + SHOPPING_LIST_BATCH_SIZE]
+        values = ', '.join(['(%s, %s, %s)'] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} '
+                f'({user_column}, {ingredient_column}, {amount_column}) '
+                f'VALUES {values} '
+                f'ON CONFLICT ({user_column}, {ingredient_column}) '
+                f'DO UPDATE SET {amount_column} = '
+                f'{table}.{amount_column} + EXCLUDED.{amount_column}',
+                [value for row in batch for value in row]
+            )
+
+
+@transaction.atomic
+def update_shopping_lists(user_ids, deltas):
+    """Применяет изменения количества ингредиентов deltas
+    ({ingredient_id: delta}) к спискам покупок пользователей.
+
+    Положительные изменения прибавляются upsert'ом, отрицательные —
+    одним UPDATE, после которого позиции с нулевым количеством удаляются
+    одним DELETE. Строки не читаются в Python, поэтому одновременные
+    изменения одного списка не теряются."""
+    user_ids = sorted(set(user_ids))
+    added = sorted(
+        (key, value) for key, value in deltas.items() if value > 0)
+    removed = {key: value for key, value in deltas.items() if value < 0}
+    if not user_ids:
+        return
+    # Строки упорядочены, чтобы одновременные upsert'ы блокировали их в
+    # одном порядке.
+    upsert_shopping_list_items([
+        (user_id, ingredient_id, delta)
+        for user_id in user_ids for ingredient_id, delta in added
+    ])
+    if not removed:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=removed)
+    items.update(amount=Greatest(
+        F('amount') + Case(
+            *(When(ingredient_id=ingredient_id, then=Value(delta))
+              for ingredient_id, delta in removed.items()),
+            output_field=IntegerField()
+        ),
+        Value(0)
+    ))
+    items.filter(amount=0).delete()
+
+
+def update_recipe_in_shopping_lists(recipe_id, deltas):
+    """Применяет изменения ингредиентов рецепта к спискам покупок всех
+    пользователей, у которых рецепт находится в корзине."""
+    if not any(deltas.values()):
+        return
+    update_shopping_lists(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True),
+        deltas
+    )
+
+
+def live_shopping_lists(user_ids=None):
+    """Списки покупок, посчитанные по корзинам без денормализации:
+    {(user_id, ingredient_id): amount}."""
+    queryset = IngredientRecipeAmount.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(recipe__user_cart__user__in=user_ids)
+    rows = queryset.values(
+        'ingredient_id', user_id=F('recipe__user_cart__user')
+    ).annotate(total=Sum('amount')).filter(user_id__isnull=False)
+    return {
+        (row['user_id'], row['ingredient_id']): row['total']
+        for row in rows.iterator()
+    }
+
+
+def stored_shopping_lists(user_ids=None):
+    """Списки покупок из денормализованной таблицы."""
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values_list(
+            'user_id', 'ingredient_id', 'amount').iterator()
+    }
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids=None):
+    """Пересобирает списки покупок по корзинам пользователей."""
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        queryset = queryset.filter(user_id__in=user_ids)
+    queryset.delete()
+    items = ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=amount)
+         for (user_id, ingredient_id), amount
+         in live_shopping_lists(user_ids).items()),
+        batch_size=1000
+    )
+    return len(items)
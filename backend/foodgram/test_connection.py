@@ -23,6 +23,9 @@ while is_no_connection:
         print('successful connection')
         os.system('python manage.py makemigrations user')
         os.system('python manage.py makemigrations recipes')
+        # Повторы ингредиентов рецептов объединяются до миграции с
+        # ограничением unique_recipe_ingredient.
+        os.system('python manage.py merge_duplicate_ingredients')
         os.system('python manage.py migrate')
         os.system('python manage.py collectstatic --noinput')
         os.system('gunicorn foodgram.wsgi:application --bind 0:8000')
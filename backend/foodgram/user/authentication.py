@@ -0,0 +1,118 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Кэш пользователей по ключу токена.
+
+    По умолчанию это LRU в памяти процесса с ограниченным временем
+    жизни записей: сброс записи виден только в этом процессе, в
+    остальных запись живёт не дольше TOKEN_CACHE_TTL. Если задан
+    TOKEN_CACHE_ALIAS, используется общий кэш Django и сброс виден
+    всем процессам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def make_key(key):
+        return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        if self.shared is not None:
+            value = self.shared.get(self.make_key(key))
+        else:
+            value = self.get_local(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.shared is not None:
+            self.shared.set(
+                self.make_key(key), value, settings.TOKEN_CACHE_TTL)
+            return
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_TTL, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        keys = list(keys)
+        if self.shared is not None:
+            self.shared.delete_many(map(self.make_key, keys))
+            return
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def collect_metrics(self):
+        """Счётчики кэша в формате Prometheus."""
+        with self.lock:
+            hits, misses, size = self.hits, self.misses, len(self.entries)
+        return [
+            '# HELP foodgram_token_cache_hits_total Попадания в кэш токенов.',
+            '# TYPE foodgram_token_cache_hits_total counter',
+            f'foodgram_token_cache_hits_total {hits}',
+            '# HELP foodgram_token_cache_misses_total Промахи кэша токенов.',
+            '# TYPE foodgram_token_cache_misses_total counter',
+            f'foodgram_token_cache_misses_total {misses}',
+            '# HELP foodgram_token_cache_size Записей в локальном кэше.',
+            '# TYPE foodgram_token_cache_size gauge',
+            f'foodgram_token_cache_size {size}',
+        ]
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе при попадании в кэш.
+
+    Кэшируются только действительные токены активных пользователей;
+    каждый запрос получает собственную копию пользователя."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (user, token))
+            return user, token
+        user, token = cached
+        return copy.copy(user), copy.copy(token)
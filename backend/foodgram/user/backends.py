@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+UserModel = get_user_model()
+
+
+class EmailBackend(ModelBackend):
+    """Вход по email: один запрос к уникальному индексу и одно
+    вычисление хэша пароля, в том числе для несуществующего email.
+
+    Возвращает и неактивных пользователей с верным паролем, чтобы
+    вызывающий код мог сообщить о запрете доступа без повторной
+    проверки пароля."""
+
+    def authenticate(self, request, email=None, password=None,
+                     username=None, **kwargs):
+        # Форма входа в админку передаёт email как username.
+        if email is None:
+            email = username
+        if email is None or password is None:
+            return None
+        user = UserModel.objects.filter(email=email).first()
+        if user is None:
+            # Время ответа не должно выдавать существование email.
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password):
+            return user
+        return None
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         BCryptSHA256PasswordHasher)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2 с параметрами из настроек. При их изменении хэш
+    пересчитывается при следующем входе пользователя."""
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    """bcrypt с количеством раундов из настроек."""
+    rounds = settings.BCRYPT_ROUNDS
@@ -1,7 +1,36 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
 
 
+# Столбцы пользователя, нужные для полей ответа, кроме id.
+USER_COLUMNS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+class UserQuerySet(models.QuerySet):
+    """Запросы пользователей с предвычисленным флагом подписки."""
+
+    def only_fields(self, fields):
+        """Загружает только столбцы для полей ответа fields, None —
+        все."""
+        if fields is None:
+            return self
+        return self.only('id', *USER_COLUMNS.intersection(fields))
+
+    def with_subscription(self, user):
+        """Аннотирует подписан ли пользователь user на автора."""
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=models.Value(
+                False, output_field=models.BooleanField()))
+        return self.annotate(is_subscribed=models.Exists(
+            Follow.objects.filter(user=user, author=models.OuterRef('pk'))
+        ))
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с методами UserQuerySet."""
+
+
 class User(AbstractUser):
     """Модель пользователя."""
     username = models.CharField(
@@ -26,10 +55,17 @@ class User(AbstractUser):
         max_length=150,
         blank=False
     )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
+    objects = UserManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -61,3 +97,24 @@ class Follow(models.Model):
                 name='unique_follow'
             )
         ]
+
+
+class LoginAttemptCounter(models.Model):
+    """Число текущих попыток входа с одного IP или для одного email.
+
+    Счётчик изменяется одним запросом к базе, поэтому одновременные
+    попытки из разных процессов не теряют изменения."""
+    key = models.CharField(
+        verbose_name='Ключ',
+        max_length=80,
+        unique=True
+    )
+    count = models.PositiveIntegerField(
+        verbose_name='Попыток',
+        default=0
+    )
+    expires = models.DateTimeField(verbose_name='Действителен до')
+
+    class Meta:
+        verbose_name = 'Счётчик попыток входа'
+        verbose_name_plural = 'Счётчики попыток входа'
@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+from user.models import User
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Сбрасывает кэш удалённого токена, например при выходе."""
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.delete((key,)))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Сбрасывает кэш токенов пользователя при изменении, в том числе
+    пароля и признака активности."""
+    if created:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: token_cache.delete(keys))
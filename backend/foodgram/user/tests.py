@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import token_cache
+from user.models import LoginAttemptCounter, User
+from user.throttling import login_guard
+
+
+class LoginConcurrencyGuardTest(TestCase):
+    """Ограничение одновременных попыток входа."""
+
+    @override_settings(LOGIN_CONCURRENCY_PER_IP=2)
+    def test_limit_per_ip(self):
+        with login_guard.guard('192.0.2.1', None):
+            with login_guard.guard('192.0.2.1', None):
+                with self.assertRaises(Throttled):
+                    with login_guard.guard('192.0.2.1', None):
+                        pass
+            with login_guard.guard('192.0.2.1', None):
+                pass
+        self.assertFalse(LoginAttemptCounter.objects.exists())
+
+    def test_double_submit_allowed(self):
+        with login_guard.guard('192.0.2.1', 'user@foodgram.ru'):
+            with login_guard.guard('192.0.2.2', 'USER@foodgram.ru'):
+                pass
+
+    @override_settings(LOGIN_CONCURRENCY_PER_EMAIL=1)
+    def test_limit_per_email(self):
+        with login_guard.guard('192.0.2.1', 'user@foodgram.ru'):
+            with self.assertRaises(Throttled):
+                with login_guard.guard('192.0.2.2', 'user@foodgram.ru'):
+                    pass
+
+    def test_expired_counter_reset(self):
+        key = login_guard.make_key('ip', '192.0.2.1')
+        LoginAttemptCounter.objects.create(
+            key=key, count=100,
+            expires=timezone.now() - timedelta(seconds=1))
+        with login_guard.guard('192.0.2.1', None):
+            self.assertEqual(
+                LoginAttemptCounter.objects.get(key=key).count, 1)
+
+
+class LoginClientIpTest(TestCase):
+    """IP клиента для ограничения берётся из адреса, дописанного nginx,
+    а не из X-Forwarded-For клиента."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(
+            email='user@foodgram.ru', username='user', first_name='Имя',
+            last_name='Фамилия', password='Pass12345!'
+        )
+
+    def login(self, forwarded_for):
+        return APIClient().post(
+            '/api/auth/token/login/',
+            {'email': 'user@foodgram.ru', 'password': 'Pass12345!'},
+            HTTP_X_FORWARDED_FOR=forwarded_for
+        )
+
+    @override_settings(LOGIN_CONCURRENCY_PER_IP=1)
+    def test_spoofed_forwarded_for_ignored(self):
+        key = login_guard.make_key('ip', '203.0.113.5')
+        self.assertTrue(login_guard.acquire(key, 1))
+        for forwarded_for in ('203.0.113.5', '198.51.100.1, 203.0.113.5',
+                              '198.51.100.2, 203.0.113.5'):
+            with self.subTest(forwarded_for=forwarded_for):
+                self.assertEqual(self.login(forwarded_for).status_code, 429)
+        login_guard.release(key)
+        self.assertEqual(self.login('203.0.113.5').status_code, 200)
+
+
+class TokenCacheTest(TestCase):
+    """Кэш токенов сбрасывается при выходе и изменении пользователя, а
+    без сброса запись живёт не дольше TOKEN_CACHE_TTL."""
+    password = 'Pass12345!'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', first_name='Имя',
+            last_name='Фамилия', password=cls.password
+        )
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.client = APIClient()
+        response = self.client.post(
+            '/api/auth/token/login/',
+            {'email': self.user.email, 'password': self.password}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.key = response.json()['auth_token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(token_cache.get_local(self.key))
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.me().status_code, 200)
+
+    def test_logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    @override_settings(
+        CACHES={'tokens': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        TOKEN_CACHE_ALIAS='tokens'
+    )
+    def test_logout_shared(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(token_cache.shared.get(
+            token_cache.make_key(self.key)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/token/logout/')
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivated(self):
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_user_changed(self):
+        self.user.first_name = 'Другое имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.me().json()['first_name'], 'Другое имя')
+
+    def test_password_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': self.password,
+                'new_password': 'NewPass12345!'
+            })
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get_local(self.key))
+        self.user.refresh_from_db()
+        self.assertEqual(self.me().status_code, 200)
+        self.assertEqual(
+            token_cache.get_local(self.key)[0].password, self.user.password)
+
+    def test_ttl(self):
+        # Сброс без фиксации транзакции: запись устаревает только по TTL.
+        Token.objects.filter(key=self.key).delete()
+        self.assertEqual(self.me().status_code, 200)
+        expired = time.monotonic() + settings.TOKEN_CACHE_TTL + 1
+        with mock.patch('user.authentication.time.monotonic',
+                        return_value=expired):
+            self.assertEqual(self.me().status_code, 401)
+        self.assertIsNone(token_cache.get_local(self.key))
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Одновременные попытки проверяются на PostgreSQL.')
+class LoginGuardConcurrencyTest(TransactionTestCase):
+    """Из одновременных попыток проходит не больше заданного числа."""
+    threads = 16
+    limit = 4
+
+    def test_concurrent_acquire(self):
+        key = login_guard.make_key('ip', '192.0.2.1')
+        start = threading.Barrier(self.threads)
+        finish = threading.Barrier(self.threads)
+
+        def attempt(_):
+            start.wait()
+            try:
+                acquired = login_guard.acquire(key, self.limit)
+                finish.wait()
+                if acquired:
+                    login_guard.release(key)
+                return acquired
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            results = list(executor.map(attempt, range(self.threads)))
+        self.assertEqual(sum(results), self.limit)
+        self.assertFalse(LoginAttemptCounter.objects.filter(
+            count__gt=0).exists())
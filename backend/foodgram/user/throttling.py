@@ -0,0 +1,94 @@
+import hashlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+
+from user.models import LoginAttemptCounter
+
+
+class LoginConcurrencyGuard:
+    """Ограничивает число одновременных попыток входа с одного IP и для
+    одного email, чтобы поток входов не занял все воркеры вычислением
+    хэшей паролей.
+
+    Счётчики хранятся в таблице LoginAttemptCounter и изменяются
+    атомарно, поэтому ограничение действует для всех процессов.
+    Счётчик, не освобождённый завершившимся процессом, сбрасывается
+    через LOGIN_GUARD_TIMEOUT секунд."""
+    message = 'Слишком много одновременных попыток входа.'
+
+    @staticmethod
+    def make_key(kind, value):
+        digest = hashlib.sha256(value.lower().encode()).hexdigest()
+        return f'login:{kind}:{digest}'
+
+    @staticmethod
+    def increment(key):
+        """Увеличивает счётчик одним INSERT ... ON CONFLICT DO UPDATE и
+        возвращает новое значение. Истёкший счётчик начинается
+        заново."""
+        adapt = connection.ops.adapt_datetimefield_value
+        now = timezone.now()
+        expires = adapt(
+            now + timedelta(seconds=settings.LOGIN_GUARD_TIMEOUT))
+        now = adapt(now)
+        quote_name = connection.ops.quote_name
+        table = quote_name(LoginAttemptCounter._meta.db_table)
+        key_column, count_column, expires_column = (
+            quote_name(LoginAttemptCounter._meta.get_field(name).column)
+            for name in ('key', 'count', 'expires')
+        )
+        expired = (f'{table}.{expires_column} < %s '
+                   f'OR {table}.{count_column} = 0')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} '
+                f'({key_column}, {count_column}, {expires_column}) '
+                f'VALUES (%s, 1, %s) ON CONFLICT ({key_column}) DO UPDATE '
+                f'SET {count_column} = CASE WHEN {expired} THEN 1 '
+                f'ELSE {table}.{count_column} + 1 END, '
+                f'{expires_column} = CASE WHEN {expired} '
+                f'THEN EXCLUDED.{expires_column} '
+                f'ELSE {table}.{expires_column} END '
+                f'RETURNING {count_column}',
+                [key, expires, now, now]
+            )
+            return cursor.fetchone()[0]
+
+    def acquire(self, key, limit):
+        if self.increment(key) > limit:
+            self.release(key)
+            return False
+        return True
+
+    @staticmethod
+    def release(key):
+        counters = LoginAttemptCounter.objects.filter(key=key)
+        counters.filter(count__gt=0).update(count=F('count') - 1)
+        counters.filter(count=0).delete()
+
+    @contextmanager
+    def guard(self, ip, email):
+        limits = [(self.make_key('ip', ip),
+                   settings.LOGIN_CONCURRENCY_PER_IP)]
+        if email:
+            limits.append((self.make_key('email', email),
+                           settings.LOGIN_CONCURRENCY_PER_EMAIL))
+        acquired = []
+        try:
+            for key, limit in limits:
+                if not self.acquire(key, limit):
+                    raise Throttled(detail=self.message)
+                acquired.append(key)
+            yield
+        finally:
+            for key in acquired:
+                self.release(key)
+
+
+login_guard = LoginConcurrencyGuard()
@@ -1,27 +1,75 @@
-from django.db.models import Q
+from django.db.models import BooleanField, Count, Prefetch, Value
 from rest_framework import status, generics, views, viewsets
 from rest_framework import permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
 
 from api import serializers
-from api.pagination import PageLimitPagination
-from api.util import add_or_del_obj
+from api.fieldsets import SparseFieldsMixin
+from api.metrics import SerializerTimingMixin
+from api.pagination import PageOrCursorPagination
+from api.util import add_or_del_obj, add_or_del_objs
+from recipes.feed import follow_authors, unfollow_authors
+from recipes.models import Recipe
 from user.permissions import CreateUserOrAdminOrReadOnly
 from user.models import User, Follow
+from user.throttling import login_guard
 from user.utils import login_user, logout_user
 
 
-class UserViewSet(viewsets.ModelViewSet):
+SUBSCRIBE_ERRORS = {
+    'error_create_myself':
+    {'error': 'Нельзя подписаться на себя.'},
+    'error_create_obj':
+    {'error': 'Автор уже находится в списке подписок.'},
+    'error_del_obj':
+    {'error': 'Автор не находится в списке подписок.'}
+}
+
+
+class UserViewSet(SerializerTimingMixin, SparseFieldsMixin,
+                  viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = serializers.UserSerializer
     permission_classes = (CreateUserOrAdminOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = PageOrCursorPagination
+
+    def get_queryset(self):
+        fields = self.get_sparse_fields()
+        queryset = User.objects.only_fields(fields)
+        if fields is None or 'is_subscribed' in fields:
+            queryset = queryset.with_subscription(self.request.user)
+        return queryset
+
+    def get_subscriptions_queryset(self):
+        """Авторы, на которых подписан пользователь, с рецептами и их
+        количеством, если они запрошены."""
+        fields = self.get_sparse_fields()
+        expand = self.get_expanded_fields()
+        authors = User.objects.filter(
+            following__user=self.request.user
+        ).only_fields(fields).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()))
+        if fields is None or 'recipes_count' in fields:
+            authors = authors.annotate(recipes_count=Count('recipes'))
+        if fields is not None and 'recipes' not in fields:
+            return authors
+        columns = ('id', 'author')
+        if expand is None or 'recipes' in expand:
+            columns += ('name', 'image', 'image_thumbnail', 'cooking_time')
+        recipes = Recipe.objects.only(*columns)
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdecimal():
+            recipes = recipes.limit_per_author(int(limit))
+        return authors.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'))
 
     def get_permissions(self):
         if self.action in (
             'subscribtions',
             'subscribe',
+            'subscribe_batch',
             'me',
             'set_password'
         ):
@@ -32,13 +80,15 @@ class UserViewSet(viewsets.ModelViewSet):
 
     def get_serializer_class(self):
         if self.action == 'subscriptions':
-            return serializers.SubscribeSerializer
+            return serializers.SubscriptionReadSerializer
         if self.action == 'create':
             return serializers.UserCreateSerializer
-        if self.action == 'me':
-            return serializers.UserSerializer
         if self.action == 'set_password':
             return serializers.SetPasswordSerializer
+        # Браузерная версия API строит формы в действиях чтения с
+        # подменённым методом запроса, им нужен полный сериализатор.
+        if self.request.method in permissions.SAFE_METHODS:
+            return serializers.UserReadSerializer
         return self.serializer_class
 
     def get_instance(self):
@@ -61,32 +111,37 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(['get'], detail=False)
     def subscriptions(self, request, *args, **kwargs):
-        pages = self.paginate_queryset(
-            User.objects.filter(following__user=request.user)
-        )
+        pages = self.paginate_queryset(self.get_subscriptions_queryset())
         serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(['post', 'delete'], detail=False,
             url_path=r'(?P<author_id>\d+)/subscribe')
     def subscribe(self, request, author_id):
-        error_message = {
-            'error_create_myself':
-            {'error': 'Нельзя подписаться на себя.'},
-            'error_create_obj':
-            {'error': 'Автор уже находится в списке подписок.'},
-            'error_del_obj':
-            {'error': 'Автор не находится в списке подписок.'}
-        }
         if request.user.id == int(author_id):
             return Response(
-                error_message['error_create_myself'],
+                SUBSCRIBE_ERRORS['error_create_myself'],
                 status=status.HTTP_400_BAD_REQUEST
             )
         serializer = serializers.SubscribeSerializer
-        return add_or_del_obj(request, Q(author__id=author_id),
+        return add_or_del_obj(request, 'author',
                               User, Follow, serializer,
-                              error_message, author_id)
+                              SUBSCRIBE_ERRORS, author_id,
+                              on_add=follow_authors,
+                              on_delete=unfollow_authors)
+
+    @action(['post', 'delete'], detail=False, url_path='subscribe',
+            serializer_class=serializers.BatchSerializer)
+    def subscribe_batch(self, request):
+        """Подписаться на авторов из списка ids или отписаться от них,
+        для каждого автора возвращается статус."""
+        return add_or_del_objs(
+            request, User, Follow, 'author', SUBSCRIBE_ERRORS,
+            on_add=follow_authors,
+            on_delete=unfollow_authors,
+            invalid={
+                request.user.id: SUBSCRIBE_ERRORS['error_create_myself']}
+        )
 
 
 class TokenCreateView(generics.GenericAPIView):
@@ -95,7 +150,10 @@ class TokenCreateView(generics.GenericAPIView):
 
     def post(self, request, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        email = request.data.get('email')
+        with login_guard.guard(BaseThrottle().get_ident(request),
+                               email if isinstance(email, str) else None):
+            serializer.is_valid(raise_exception=True)
         return self._action(serializer)
 
     def _action(self, serialzier):